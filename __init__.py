@@ -62,6 +62,10 @@ from lib import common_drawing
 from polystrips import *
 import polystrips_utilities
 from polystrips_draw import *
+from polystrips_surface import *
+from polystrips_drawcache import DrawCache
+from polystrips_visibility import VisibilityCache
+from polystrips_update import ZipCycleError
 
 
 # Used to store keymaps for addon
@@ -228,14 +232,13 @@ class PolystripsUI:
         self.sketch_curpos = (0, 0)
         self.sketch_pressure = 1
         self.sketch = []
+        self.sketch_resampler = None
 
         self.post_update = True
 
         self.footer = ''
         self.footer_last = ''
 
-        self.last_matrix = None
-
         self._timer = context.window_manager.event_timer_add(0.1, context.window)
 
         self.stroke_smoothing = 0.75          # 0: no smoothing. 1: no change
@@ -308,9 +311,18 @@ class PolystripsUI:
         self.sel_gvert = None                           # selected gvert
         self.act_gvert = None                           # active gvert (operated upon)
 
-        self.polystrips = PolyStrips(context, self.obj)
+        # closest point queries go through a cached BVH of the source mesh
+        self.surface = create_surface_index(self.obj, self.bme)
+        self.polystrips = PolyStrips(context, self.surface)
+        self.drawcache = DrawCache(self.polystrips)
+        self.visibility = VisibilityCache(self.polystrips)
+
+        # world matrices (and inverses) of source and target objects, checked once per event
+        self.xform = self.polystrips.xform
+        self.to_xform = TransformContext(self.to_obj.matrix_world) if self.to_obj else None
+        self.set_snap_points()
 
-        polystrips_undo_cache = []  # Clear the cache in case any is left over
+        del polystrips_undo_cache[:]  # Clear the cache in case any is left over
         if self.obj.grease_pencil:
             self.create_polystrips_from_greasepencil()
         elif 'BezierCurve' in bpy.data.objects:
@@ -321,9 +333,9 @@ class PolystripsUI:
     ###############################
     def create_undo_snapshot(self, action):
         '''
-        unsure about all the _timers get deep copied
-        and if sel_gedges and verts get copied as references
-        or also duplicated, making them no longer valid.
+        snapshots are copy-on-write (see polystrips_undo): taking one only
+        copies the gvert/gedge lists, and each gvert/gedge is copied the first
+        time it changes afterwards
         '''
 
         settings = common_utilities.get_settings()
@@ -334,7 +346,7 @@ class PolystripsUI:
                 print('repeatable...dont take snapshot')
                 return
 
-        p_data = copy.deepcopy(self.polystrips)
+        p_data = self.polystrips.snapshot()
 
         if self.sel_gedge:
             sel_gedge = self.polystrips.gedges.index(self.sel_gedge)
@@ -347,7 +359,7 @@ class PolystripsUI:
             sel_gvert = None
 
         if self.act_gvert:
-            act_gvert = self.polystrips.gverts.index(self.sel_gvert)
+            act_gvert = self.polystrips.gverts.index(self.act_gvert)
         else:
             act_gvert = None
 
@@ -355,6 +367,7 @@ class PolystripsUI:
 
         if len(polystrips_undo_cache) > settings.undo_depth:
             polystrips_undo_cache.pop(0)
+            self.polystrips.undo.drop_oldest()
 
     def undo_action(self):
         '''
@@ -362,19 +375,19 @@ class PolystripsUI:
         if len(polystrips_undo_cache) > 0:
             data, action = polystrips_undo_cache.pop()
 
-            self.polystrips = data[0]
+            self.polystrips.restore_snapshot(data[0])
 
-            if data[1]:
+            if data[1] is not None:
                 self.sel_gvert = self.polystrips.gverts[data[1]]
             else:
                 self.sel_gvert = None
 
-            if data[2]:
+            if data[2] is not None:
                 self.sel_gedge = self.polystrips.gedges[data[2]]
             else:
                 self.sel_gedge = None
 
-            if data[3]:
+            if data[3] is not None:
                 self.act_gvert = self.polystrips.gverts[data[3]]
             else:
                 self.act_gvert = None
@@ -400,30 +413,36 @@ class PolystripsUI:
     ################################
     # Draw functions
 
-    def draw_callback(self, context):
-        settings = common_utilities.get_settings()
-        region,r3d = context.region,context.space_data.region_3d
+    def set_snap_points(self):
+        if not self.snap_eds: return
+        mx = self.to_xform.mx
+        self.visibility.set_static_points([[mx * v.co for v in ed.verts] for ed in self.snap_eds])
 
-        new_matrix = [v for l in r3d.view_matrix for v in l]
-        if self.post_update or self.last_matrix != new_matrix:
-            for gv in self.polystrips.gverts:
-                gv.update_visibility(r3d)
-            for ge in self.polystrips.gedges:
-                ge.update_visibility(r3d)
-            if self.sel_gedge:
-                for gv in [self.sel_gedge.gvert1, self.sel_gedge.gvert2]:
-                    gv.update_visibility(r3d)
-            if self.sel_gvert:
-                for gv in self.sel_gvert.get_inner_gverts():
-                    gv.update_visibility(r3d)
-
-            if len(self.snap_eds):
-                mx = self.obj.matrix_world
-                self.snap_eds_vis = [False not in common_utilities.ray_cast_visible([mx * ed.verts[0].co, mx * ed.verts[1].co], self.obj, r3d) for ed in self.snap_eds]
+    def update_transforms(self):
+        '''
+        picks up changes to the world matrices of the source and target objects
+        '''
+        changed = self.xform.set_matrix(self.obj.matrix_world)
+        if self.to_xform and self.to_xform.set_matrix(self.to_obj.matrix_world):
+            self.set_snap_points()
+            changed = True
+        if changed: self.visibility.invalidate_all()
 
+    def update_visibility(self, r3d):
+        '''
+        ray casts whatever changed since the last call (or everything, if the view changed)
+        '''
+        if self.post_update:
+            self.visibility.invalidate_all()
             self.post_update = False
-            self.last_matrix = new_matrix
+        self.visibility.update(r3d)
+        self.snap_eds_vis = self.visibility.static_visible
+
+    def draw_callback(self, context):
+        settings = common_utilities.get_settings()
+        region,r3d = context.region,context.space_data.region_3d
 
+        self.update_visibility(r3d)
 
         if settings.debug < 3:
             self.draw_callback_themed(context)
@@ -443,49 +462,18 @@ class PolystripsUI:
 
         bgl.glEnable(bgl.GL_POINT_SMOOTH)
 
-        for i_ge,gedge in enumerate(self.polystrips.gedges):
-            if gedge == self.sel_gedge:
-                color_border = (color_selection[0], color_selection[1], color_selection[2], 1.00)
-                color_fill = (color_selection[0], color_selection[1], color_selection[2], 0.20)
-            else:
-                color_border = (color_inactive[0], color_inactive[1], color_inactive[2], 1.00)
-                color_fill = (color_inactive[0], color_inactive[1], color_inactive[2], 0.20)
-
-            for c0,c1,c2,c3 in gedge.iter_segments(only_visible=True):
-                common_drawing.draw_quads_from_3dpoints(context, [c0,c1,c2,c3], color_fill)
-                common_drawing.draw_polyline_from_3dpoints(context, [c0,c1,c2,c3,c0], color_border, 1, "GL_LINE_STIPPLE")
+        sel_gedges = [self.sel_gedge] if self.sel_gedge else []
+        sel_gverts = [self.sel_gvert] if self.sel_gvert else []
+        if self.sel_gedge: sel_gverts += self.sel_gedge.gverts()
+        draw_drawcache(context, self.drawcache, color_inactive, color_selection, sel_gedges, sel_gverts)
 
-            if settings.debug >= 2:
+        if settings.debug >= 2:
+            for gedge in self.polystrips.gedges:
                 # draw bezier
                 p0,p1,p2,p3 = gedge.gvert0.snap_pos, gedge.gvert1.snap_pos, gedge.gvert2.snap_pos, gedge.gvert3.snap_pos
-                p3d = [cubic_bezier_blend_t(p0,p1,p2,p3,t/16.0) for t in range(17)]
+                p3d = cubic_bezier_blend_ts(p0,p1,p2,p3, [t/16.0 for t in range(17)])
                 common_drawing.draw_polyline_from_3dpoints(context, p3d, (1,1,1,0.5),1, "GL_LINE_STIPPLE")
 
-        for i_gv,gv in enumerate(self.polystrips.gverts):
-            if not gv.is_visible(): continue
-            p0,p1,p2,p3 = gv.get_corners()
-
-            if gv.is_unconnected(): continue
-
-            is_selected = False
-            is_selected |= gv == self.sel_gvert
-            is_selected |= self.sel_gedge!=None and (self.sel_gedge.gvert0 == gv or self.sel_gedge.gvert1 == gv)
-            is_selected |= self.sel_gedge!=None and (self.sel_gedge.gvert2 == gv or self.sel_gedge.gvert3 == gv)
-            if is_selected:
-                color_border = (color_selection[0], color_selection[1], color_selection[2], 1.00)
-                color_fill   = (color_selection[0], color_selection[1], color_selection[2], 0.20)
-            else:
-                color_border = (color_inactive[0], color_inactive[1], color_inactive[2], 1.00)
-                color_fill   = (color_inactive[0], color_inactive[1], color_inactive[2], 0.20)
-
-            p3d = [p0,p1,p2,p3,p0]
-            common_drawing.draw_quads_from_3dpoints(context, [p0,p1,p2,p3], color_fill)
-            common_drawing.draw_polyline_from_3dpoints(context, p3d, color_border, 1, "GL_LINE_STIPPLE")
-
-        p3d = [gvert.position for gvert in self.polystrips.gverts if not gvert.is_unconnected() and gvert.is_visible()]
-        color = (color_inactive[0], color_inactive[1], color_inactive[2], 1.00)
-        common_drawing.draw_3d_points(context, p3d, color, 4)
-
         if self.sel_gvert:
             color = (color_selection[0], color_selection[1], color_selection[2], 1.00)
             gv = self.sel_gvert
@@ -549,8 +537,7 @@ class PolystripsUI:
             ray,hit = common_utilities.ray_cast_region2d(region, r3d, self.cur_pos, self.obj, settings)
             hit_p3d,hit_norm,hit_idx = hit
             if hit_idx != -1: # and not self.hover_ed:
-                mx = self.obj.matrix_world
-                mxnorm = mx.transposed().inverted().to_3x3()
+                mx,mxnorm = self.xform.mx,self.xform.mxnorm
                 hit_p3d = mx * hit_p3d
                 hit_norm = mxnorm * hit_norm
                 common_drawing.draw_circle(context, hit_p3d, hit_norm.normalized(), self.stroke_radius_pressure, (1,1,1,.5))
@@ -558,15 +545,14 @@ class PolystripsUI:
                 ray,hit = common_utilities.ray_cast_region2d(region, r3d, self.sketch[0][0], self.obj, settings)
                 hit_p3d,hit_norm,hit_idx = hit
                 if hit_idx != -1:
-                    mx = self.obj.matrix_world
-                    mxnorm = mx.transposed().inverted().to_3x3()
+                    mx,mxnorm = self.xform.mx,self.xform.mxnorm
                     hit_p3d = mx * hit_p3d
                     hit_norm = mxnorm * hit_norm
                     common_drawing.draw_circle(context, hit_p3d, hit_norm.normalized(), self.stroke_radius_pressure, (1,1,1,.5))
 
         if self.hover_ed and False:
             color = (color_selection[0], color_selection[1], color_selection[2], 1.00)
-            common_drawing.draw_bmedge(context, self.hover_ed, self.to_obj.matrix_world, 2, color)
+            common_drawing.draw_bmedge(context, self.hover_ed, self.to_xform.mx, 2, color)
 
 
     def draw_callback_debug(self, context):
@@ -627,7 +613,7 @@ class PolystripsUI:
 
             if draw_gedge_bezier:
                 p0,p1,p2,p3 = gedge.gvert0.snap_pos, gedge.gvert1.snap_pos, gedge.gvert2.snap_pos, gedge.gvert3.snap_pos
-                p3d = [cubic_bezier_blend_t(p0,p1,p2,p3,t/16.0) for t in range(17)]
+                p3d = cubic_bezier_blend_ts(p0,p1,p2,p3, [t/16.0 for t in range(17)])
                 common_drawing.draw_polyline_from_3dpoints(context, p3d, (0.5,0.5,0.5,0.8),1, "GL_LINE_SMOOTH")
 
             col = color_gedge if len(gedge.cache_igverts) else color_gedge_nocuts
@@ -642,8 +628,9 @@ class PolystripsUI:
 
             if draw_gedge_igverts:
                 rm = (gedge.gvert0.radius + gedge.gvert3.radius)*0.1
-                for igv in gedge.cache_igverts:
-                    common_drawing.common_drawing.draw_circle(context, igv.position, igv.normal, rm, (1,1,1,.3))
+                strip = gedge.cache_igverts
+                for p,n in zip(strip.positions, strip.normals):
+                    common_drawing.common_drawing.draw_circle(context, p, n, rm, (1,1,1,.3))
 
         for i_gv,gv in enumerate(self.polystrips.gverts):
             if not gv.is_visible(): continue
@@ -715,37 +702,58 @@ class PolystripsUI:
             ray,hit = common_utilities.ray_cast_region2d(region, r3d, self.cur_pos, self.obj, settings)
             hit_p3d,hit_norm,hit_idx = hit
             if hit_idx != -1:
-                mx = self.obj.matrix_world
+                mx = self.xform.mx
                 hit_p3d = mx * hit_p3d
                 common_drawing.draw_circle(context, hit_p3d, hit_norm.normalized(), self.stroke_radius_pressure, (1,1,1,.5))
 
         if not self.hover_ed:
             self.sketch_brush.draw(context)
         else:
-            common_drawing.draw_bmedge(context, self.hover_ed, self.to_obj.matrix_world, 2, color_selected)
+            common_drawing.draw_bmedge(context, self.hover_ed, self.to_xform.mx, 2, color_selected)
 
     ############################
     # function to convert polystrips => mesh
 
-    def create_mesh(self, context):
-        verts,quads = self.polystrips.create_mesh()
+    def fill_mesh(self, me, co, quads):
+        '''
+        writes flat buffers of create_mesh_buffers into empty mesh me with bulk foreach_set calls
+        '''
+        nv,nq = len(co)//3, len(quads)//4
+        me.vertices.add(nv)
+        me.vertices.foreach_set('co', co)
+        me.loops.add(4*nq)
+        me.loops.foreach_set('vertex_index', quads)
+        me.polygons.add(nq)
+        me.polygons.foreach_set('loop_start', range(0, 4*nq, 4))
+        me.polygons.foreach_set('loop_total', [4]*nq)
+        me.update(calc_edges=True)
+        me.validate()
 
+    def create_mesh(self, context):
         if self.to_bme and self.to_obj:  #EDIT MDOE on Existing Mesh
+            # world space straight into the target object (one matrix for all verts)
+            co,quads = self.polystrips.create_mesh_buffers(self.to_xform.imx)
+
+            # bmesh has no bulk constructor; build a temporary mesh and append it
+            tmp_me = bpy.data.meshes.new('polystrips_tmp')
+            self.fill_mesh(tmp_me, co, quads)
             bm = self.to_bme
-            mx = self.to_obj.matrix_world
-            imx = mx.inverted()
+            bm.from_mesh(tmp_me)
+            bpy.data.meshes.remove(tmp_me)
+            bm.verts.index_update()
+            bm.faces.index_update()
 
-            mx2 = self.obj.matrix_world
-            imx2 = mx2.inverted()
+            bmesh.update_edit_mesh(self.to_obj.data, tessface=False, destructive=True)
+            bm.free()
 
         else:
-            bm = bmesh.new()
-            mx2 = Matrix.Identity(4)
-            imx = Matrix.Identity(4)
+            # new object shares the matrix of the source object
+            co,quads = self.polystrips.create_mesh_buffers()
 
             nm_polystrips = self.obj.name + "_polystrips"
 
             dest_me  = bpy.data.meshes.new(nm_polystrips)
+            self.fill_mesh(dest_me, co, quads)
             dest_obj = bpy.data.objects.new(nm_polystrips, dest_me)
 
             dest_obj.matrix_world = self.obj.matrix_world
@@ -758,20 +766,6 @@ class PolystripsUI:
             dest_obj.select = True
             context.scene.objects.active = dest_obj
 
-        bmverts = [bm.verts.new(imx * mx2 * v) for v in verts]
-        bm.verts.index_update()
-        for q in quads: 
-            bm.faces.new([bmverts[i] for i in q])
-
-        bm.faces.index_update()
-
-        if self.to_bme and self.to_obj:
-            bmesh.update_edit_mesh(self.to_obj.data, tessface=False, destructive=True)
-            bm.free()
-        else: 
-            bm.to_mesh(dest_me)
-            bm.free()
-
     ###########################
     # hover functions
 
@@ -780,14 +774,11 @@ class PolystripsUI:
             return 
         context = eventd['context']
         region,r3d = context.region,context.space_data.region_3d
-        new_matrix = [v for l in r3d.view_matrix for v in l]
         x, y = eventd['mouse']
         mouse_loc = Vector((x,y))
-        mx = self.to_obj.matrix_world
+        mx = self.to_xform.mx
 
-        if self.post_update or self.last_matrix != new_matrix:
-            # Update all the visibility stuff
-            self.snap_eds_vis = [False not in common_utilities.ray_cast_visible([mx * ed.verts[0].co, mx * ed.verts[1].co], self.obj, r3d) for ed in self.snap_eds]
+        self.update_visibility(r3d)
 
         # Sticky highlight...check the hovered edge first
         if self.hover_ed:
@@ -859,22 +850,24 @@ class PolystripsUI:
         elif command == 'commit':
             pass
         elif command == 'undo':
-            for gv,p in self.tool_data:
-                gv.position = p
-                gv.update()
-            self.sel_gvert.update()
-            self.sel_gvert.update_visibility(eventd['r3d'], update_gedges=True)
+            with self.polystrips.batch_updates():
+                for gv,p in self.tool_data:
+                    gv.position = p
+                    gv.update()
+                self.sel_gvert.update()
+            self.update_visibility(eventd['r3d'])
         else:
             m = command
             sgv = self.sel_gvert
             p = sgv.position
-            for ge in sgv.get_gedges():
-                if not ge: continue
-                gv = ge.gvert1 if ge.gvert0 == self.sel_gvert else ge.gvert2
-                gv.position = p + (gv.position-p) * m
-                gv.update()
-            sgv.update()
-            self.sel_gvert.update_visibility(eventd['r3d'], update_gedges=True)
+            with self.polystrips.batch_updates():
+                for ge in sgv.get_gedges():
+                    if not ge: continue
+                    gv = ge.gvert1 if ge.gvert0 == self.sel_gvert else ge.gvert2
+                    gv.position = p + (gv.position-p) * m
+                    gv.update()
+                sgv.update()
+            self.update_visibility(eventd['r3d'])
 
     def scale_tool_gvert_radius(self, command, eventd):
         if command == 'init':
@@ -885,12 +878,12 @@ class PolystripsUI:
         elif command == 'undo':
             self.sel_gvert.radius = self.tool_data
             self.sel_gvert.update()
-            self.sel_gvert.update_visibility(eventd['r3d'], update_gedges=True)
+            self.update_visibility(eventd['r3d'])
         else:
             m = command
             self.sel_gvert.radius *= m
             self.sel_gvert.update()
-            self.sel_gvert.update_visibility(eventd['r3d'], update_gedges=True)
+            self.update_visibility(eventd['r3d'])
 
     def scale_tool_stroke_radius(self, command, eventd):
         if command == 'init':
@@ -920,9 +913,9 @@ class PolystripsUI:
             pass
         elif command == 'undo':
             for gv,p,_ in self.tool_data: gv.position = p
-            for gv,_,_ in self.tool_data:
-                gv.update()
-                gv.update_visibility(eventd['r3d'], update_gedges=True)
+            with self.polystrips.batch_updates():
+                for gv,_,_ in self.tool_data: gv.update()
+            self.update_visibility(eventd['r3d'])
         else:
             factor_slow,factor_fast = 0.2,1.0
             dv = Vector(command) * (factor_slow if eventd['shift'] else factor_fast)
@@ -932,9 +925,9 @@ class PolystripsUI:
             if len(pts) != len(lgv2d): return ''
             for d,p2d in zip(self.tool_data, pts):
                 d[0].position = p2d
-            for gv,_,_ in self.tool_data:
-                gv.update()
-                gv.update_visibility(eventd['r3d'], update_gedges=True)
+            with self.polystrips.batch_updates():
+                for gv,_,_ in self.tool_data: gv.update()
+            self.update_visibility(eventd['r3d'])
 
     def grab_tool_gvert(self, command, eventd):
         '''
@@ -974,16 +967,18 @@ class PolystripsUI:
         elif command == 'commit':
             pass
         elif command == 'undo':
-            for gv,p in self.tool_data:
-                gv.position = p
-                gv.update()
+            with self.polystrips.batch_updates():
+                for gv,p in self.tool_data:
+                    gv.position = p
+                    gv.update()
         else:
             ang = command
             q = Quaternion(self.sel_gvert.snap_norm, ang)
             p = self.sel_gvert.position
-            for gv,up in self.tool_data:
-                gv.position = p+q*(up-p)
-                gv.update()
+            with self.polystrips.batch_updates():
+                for gv,up in self.tool_data:
+                    gv.position = p+q*(up-p)
+                    gv.update()
 
     def scale_brush_pixel_radius(self,command, eventd):
         if command == 'init':
@@ -1061,7 +1056,13 @@ class PolystripsUI:
         # accept / cancel
 
         if eventd['press'] in {'RET', 'NUMPAD_ENTER'}:
-            self.create_mesh(eventd['context'])
+            try:
+                self.create_mesh(eventd['context'])
+            except ZipCycleError as e:
+                # nothing was written; let the user unzip and try again
+                print('Cannot create mesh: ' + str(e))
+                eventd['context'].area.header_text_set('Cannot create mesh: ' + str(e))
+                return ''
             eventd['context'].area.header_text_set()
             return 'finish'
 
@@ -1103,7 +1104,7 @@ class PolystripsUI:
             for stroke in self.strokes_original:
                 self.polystrips.insert_gedge_from_stroke(stroke, True)
             self.polystrips.remove_unconnected_gverts()
-            self.polystrips.update_visibility(eventd['r3d'])
+            self.update_visibility(eventd['r3d'])
             return ''
 
         if eventd['press'] in {'LEFTMOUSE', 'SHIFT+LEFTMOUSE'}:
@@ -1116,12 +1117,14 @@ class PolystripsUI:
 
             self.sketch_curpos = (x,y)
 
+            # sketch is resampled as it is drawn, so it is evenly sampled when released
+            self.sketch_resampler = StrokeResampler()
             if eventd['shift'] and self.sel_gvert:
                 # continue sketching from selected gvert position
                 gvx,gvy = location_3d_to_region_2d(eventd['region'], eventd['r3d'], self.sel_gvert.position)
-                self.sketch = [((gvx,gvy),self.sel_gvert.radius), ((x,y),r)]
+                self.sketch = list(self.sketch_resampler.resample([((gvx,gvy),self.sel_gvert.radius), ((x,y),r)]))
             else:
-                self.sketch = [((x,y),r)]
+                self.sketch = list(self.sketch_resampler.resample([((x,y),r)]))
 
             self.sel_gvert = None
             self.sel_gedge = None
@@ -1152,15 +1155,13 @@ class PolystripsUI:
                     self.sel_gedge = None
                     return ''
 
-            for gv in self.polystrips.gverts:
+            for gv in self.polystrips.pick_gverts(pt):
                 if gv.is_unconnected(): continue
-                if not gv.is_picked(pt): continue
                 self.sel_gvert = gv
                 self.sel_gedge = None
                 return ''
 
-            for ge in self.polystrips.gedges:
-                if not ge.is_picked(pt): continue
+            for ge in self.polystrips.pick_gedges(pt):
                 self.sel_gvert = None
                 self.sel_gedge = ge
                 return ''
@@ -1176,8 +1177,7 @@ class PolystripsUI:
                 return ''
             pt = pts[0]
 
-            for gv in self.polystrips.gverts:
-                if not gv.is_picked(pt): continue
+            for gv in self.polystrips.pick_gverts(pt):
                 if not (gv.is_endpoint() or gv.is_endtoend() or gv.is_ljunction()): continue
 
                 if gv.is_endpoint():
@@ -1186,15 +1186,13 @@ class PolystripsUI:
                     self.polystrips.dissolve_gvert(gv)
 
                 self.polystrips.remove_unconnected_gverts()
-                self.polystrips.update_visibility(eventd['r3d'])
+                self.update_visibility(eventd['r3d'])
 
                 self.sel_gvert = None
                 self.sel_gedge = None
                 return ''
 
-            for ge in self.polystrips.gedges:
-                if not ge.is_picked(pt): continue
-
+            for ge in self.polystrips.pick_gedges(pt):
                 self.polystrips.disconnect_gedge(ge)
                 self.polystrips.remove_unconnected_gverts()
 
@@ -1207,8 +1205,9 @@ class PolystripsUI:
 
         if eventd['press'] == 'CTRL+U':
             self.create_undo_snapshot('update')
-            for gv in self.polystrips.gverts:
-                gv.update_gedges()
+            with self.polystrips.batch_updates():
+                for gv in self.polystrips.gverts:
+                    gv.update_gedges()
 
         ###################################
         # Selected gedge commands
@@ -1273,9 +1272,8 @@ class PolystripsUI:
                 if not pts:
                     return ''
                 pt = pts[0]
-                for ge in self.polystrips.gedges:
+                for ge in self.polystrips.pick_gedges(pt):
                     if ge == self.sel_gedge: continue
-                    if not ge.is_picked(pt): continue
                     self.create_undo_snapshot('zip')
                     self.sel_gedge.zip_to(ge)
                     return ''
@@ -1317,8 +1315,7 @@ class PolystripsUI:
                 if not pts:
                     return ''
                 pt = pts[0]
-                for ge in self.polystrips.gedges:
-                    if not ge.is_picked(pt): continue
+                for ge in self.polystrips.pick_gedges(pt):
                     self.create_undo_snapshot('split')
                     t,d = ge.get_closest_point(pt)
                     self.polystrips.split_gedge_at_t(ge, t, connect_gvert=self.sel_gvert)
@@ -1339,7 +1336,7 @@ class PolystripsUI:
                 self.polystrips.dissolve_gvert(self.sel_gvert)
                 self.sel_gvert = None
                 self.polystrips.remove_unconnected_gverts()
-                self.polystrips.update_visibility(eventd['r3d'])
+                self.update_visibility(eventd['r3d'])
                 return ''
 
             if eventd['press'] == 'S':
@@ -1360,7 +1357,7 @@ class PolystripsUI:
             if eventd['press'] == 'CTRL+C':
                 self.create_undo_snapshot('toggle')
                 self.sel_gvert.toggle_corner()
-                self.sel_gvert.update_visibility(eventd['r3d'], update_gedges=True)
+                self.update_visibility(eventd['r3d'])
                 return ''
 
             if eventd['press'] == 'CTRL+S':
@@ -1371,7 +1368,7 @@ class PolystripsUI:
             if eventd['press'] == 'C':
                 self.create_undo_snapshot('smooth')
                 self.sel_gvert.smooth()
-                self.sel_gvert.update_visibility(eventd['r3d'], update_gedges=True)
+                self.update_visibility(eventd['r3d'])
                 return ''
 
             if eventd['press'] == 'R':
@@ -1408,8 +1405,8 @@ class PolystripsUI:
                     return ''
                 pt = pts[0]
                 sel_ge = set(self.sel_gvert.get_gedges_notnone())
-                for gv in self.polystrips.gverts:
-                    if gv.is_inner() or not gv.is_picked(pt) or gv == self.sel_gvert: continue
+                for gv in self.polystrips.pick_gverts(pt):
+                    if gv.is_inner() or gv == self.sel_gvert: continue
                     if len(self.sel_gvert.get_gedges_notnone()) + len(gv.get_gedges_notnone()) > 4:
                         dprint('Too many connected GEdges for merge!')
                         continue
@@ -1463,7 +1460,7 @@ class PolystripsUI:
             # Smooth radii
             self.stroke_radius_pressure = lr*ss0 + r*ss1
 
-            self.sketch += [((lx*ss0+x*ss1, ly*ss0+y*ss1), self.stroke_radius_pressure)]
+            self.sketch += self.sketch_resampler.add((lx*ss0+x*ss1, ly*ss0+y*ss1), self.stroke_radius_pressure)
 
             return ''
 
@@ -1488,7 +1485,7 @@ class PolystripsUI:
             dprint('inserting stroke')
             self.polystrips.insert_gedge_from_stroke(stroke, False)
             self.polystrips.remove_unconnected_gverts()
-            self.polystrips.update_visibility(eventd['r3d'])
+            self.update_visibility(eventd['r3d'])
             return 'main'
 
         return ''
@@ -1596,6 +1593,7 @@ class PolystripsUI:
         settings = common_utilities.get_settings()
 
         eventd = self.get_event_details(context, event)
+        self.update_transforms()
 
         if self.footer_last != self.footer:
             context.area.header_text_set('PolyStrips: %s' % self.footer)
@@ -1614,12 +1612,15 @@ class PolystripsUI:
         nmode = FSM[self.mode](eventd)
         self.mode_pos = eventd['mouse']
 
+        self.polystrips.graph.end_frame()
+        self.surface.end_frame()
+
         self.is_navigating = (nmode == 'nav')
         if nmode == 'nav': return {'PASS_THROUGH'}
 
         if nmode in {'finish','cancel'}:
             self.kill_timer(context)
-            polystrips_undo_cache = []
+            del polystrips_undo_cache[:]
             return {'FINISHED'} if nmode == 'finish' else {'CANCELLED'}
 
         if nmode: self.mode = nmode
@@ -1639,7 +1640,7 @@ class PolystripsUI:
             n0  = Vector((0,0,1))
             tx0 = Vector((1,0,0))
             ty0 = Vector((0,1,0))
-            return GVert(self.obj,p0,r0,n0,tx0,ty0)
+            return GVert(self.surface,self.length_scale,p0,r0,n0,tx0,ty0,self.polystrips.graph)
 
         for spline in data.splines:
             pregv = None
@@ -1649,7 +1650,7 @@ class PolystripsUI:
                 gv2 = self.create_gvert(mx, bp1.handle_left, 0.2)
                 gv3 = self.create_gvert(mx, bp1.co, 0.2)
 
-                ge0 = GEdge(self.obj, gv0, gv1, gv2, gv3)
+                ge0 = GEdge(self.surface, self.length_scale, gv0, gv1, gv2, gv3)
                 ge0.recalc_igverts_approx()
                 ge0.snap_igverts_to_object()
 
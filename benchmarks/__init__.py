@@ -0,0 +1,35 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# Benchmarks for the polystrips core.  They build PolyStrips graphs on
+# synthetic meshes (MeshSurfaceIndex), so no source object is needed.
+# Run from the addon folder with Blender's python, for example:
+#
+#     blender --background --python benchmarks/bench_core.py -- --counts 10 100
+#     blender --background --python benchmarks/bench_undo.py
+#     blender --background --python benchmarks/bench_segcount.py
+#     blender --background --python benchmarks/bench_compact.py
+#
+# or with any python 3 (the core then uses polystrips_headless for mathutils):
+#
+#     python3 benchmarks/bench_core.py --counts 10 100
+#
+# scenes.py has the procedural surfaces (sphere, torus, head) and stroke sets
@@ -0,0 +1,125 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# compares compact_vert_indices (array remap) against the dict based
+# compaction it replaced at the end of PolyStrips.build_mesh.  both must give
+# the same verts and quads; then both are timed and their peak allocation
+# is measured on meshes of growing size
+
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from array import array
+
+# the addon modules import each other as top level modules
+path_here = os.path.dirname(os.path.abspath(__file__))
+for path in [path_here, os.path.dirname(path_here)]:
+    if path not in sys.path: sys.path.append(path)
+
+from polystrips_utilities import compact_vert_indices
+
+
+
+def compact_dict(verts, quads):
+    '''
+    the compaction of PolyStrips.create_mesh before compact_vert_indices
+    '''
+    vind_used = [False for v in verts]
+    for q in quads:
+        for vind in q:
+            vind_used[vind] = True
+    i_new = 0
+    map_vinds = {}
+    for i_vind,used in enumerate(vind_used):
+        if used:
+            map_vinds[i_vind] = i_new
+            i_new += 1
+    verts = [v for u,v in zip(vind_used,verts) if u]
+    quads = [tuple(map_vinds[vind] for vind in q) for q in quads]
+    return (verts, quads)
+
+def compact_array(verts, quads):
+    keep,quads,n_orphans = compact_vert_indices(len(verts), quads)
+    return ([verts[i] for i in keep], quads)
+
+def mesh(n_quads, orphans, seed=0):
+    '''
+    returns (verts, flat quad indices) shaped like build_mesh output: a grid of
+    quads whose verts are interleaved with a fraction of unused verts
+    '''
+    rnd = random.Random(seed)
+    w = max(1, int(n_quads ** 0.5))
+    h = (n_quads + w - 1) // w
+    grid = {}
+    verts = []
+    for j in range(h+1):
+        for i in range(w+1):
+            while rnd.random() < orphans: verts.append((rnd.random(), rnd.random(), -1.0))
+            grid[(i,j)] = len(verts)
+            verts.append((float(i), float(j), 0.0))
+    quads = array('i')
+    for k in range(n_quads):
+        i,j = k % w, k // w
+        quads.extend((grid[(i,j)], grid[(i+1,j)], grid[(i+1,j+1)], grid[(i,j+1)]))
+    return (verts, quads)
+
+def measure(fn, verts, quads, repeat):
+    best = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn(verts, quads)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    tracemalloc.start()
+    fn(verts, quads)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (best, peak)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='mesh vert compaction: array remap vs dict')
+    parser.add_argument('--quads', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--orphans', type=float, default=0.05, help='chance of an unused vert before each used vert')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print('%8s %8s %8s %10s %10s %8s %10s %10s' % ('quads', 'verts', 'orphans', 'dict ms', 'array ms', 'speedup', 'dict KB', 'array KB'))
+    for n in args.quads:
+        verts,quads = mesh(n, args.orphans, seed=n)
+        lquads = [tuple(quads[i:i+4]) for i in range(0, len(quads), 4)]
+        v0,q0 = compact_dict(verts, lquads)
+        v1,q1 = compact_array(verts, quads)
+        if v0 != v1 or [i for q in q0 for i in q] != list(q1):
+            print('%8i: compacted meshes differ' % n)
+            return 1
+        t0,m0 = measure(compact_dict, verts, lquads, args.repeat)
+        t1,m1 = measure(compact_array, verts, quads, args.repeat)
+        print('%8i %8i %8i %10.1f %10.1f %7.1fx %10i %10i' % (n, len(verts), len(verts)-len(v1), t0*1000, t1*1000, t0/t1, m0//1024, m1//1024))
+    return 0
+
+if __name__ == '__main__':
+    # blender passes its own arguments; ours come after '--'
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,209 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# times the PolyStrips core operations on procedural surfaces and prints JSON
+#
+#     blender --background --python benchmarks/bench_core.py -- --counts 10 100 --output bench.json
+#
+# for each scene and strip count, every operation is run once without
+# tracemalloc for timing and once more on a fresh graph with tracemalloc for
+# allocations (peak KB and net blocks still allocated afterwards).  each
+# operation also records the surface queries it made (surface_calls and
+# surface_points, from SurfaceIndex.end_frame)
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+# the addon modules import each other as top level modules
+path_here = os.path.dirname(os.path.abspath(__file__))
+for path in [path_here, os.path.dirname(path_here)]:
+    if path not in sys.path: sys.path.append(path)
+
+from polystrips_math import Vector
+
+from scenes import Scene
+
+
+
+class Run(object):
+    '''
+    one pass over all operations on a fresh graph
+    '''
+    def __init__(self, scene, n_strips, trace):
+        self.scene = scene
+        self.n_strips = n_strips
+        self.trace = trace
+        self.ops = {}
+
+    def measure(self, name, fn):
+        '''
+        runs fn(), which returns the number of operations it did
+        '''
+        surface = self.scene.surface
+        surface.end_frame()
+        if self.trace:
+            tracemalloc.start()
+            blocks = sys.getallocatedblocks()
+        t = time.perf_counter()
+        count = fn()
+        t = time.perf_counter() - t
+        calls,points = surface.end_frame()
+        op = {'count': count, 'surface_calls': calls, 'surface_points': points}
+        if self.trace:
+            op['alloc_blocks'] = sys.getallocatedblocks() - blocks
+            op['alloc_peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024.0
+            tracemalloc.stop()
+        else:
+            op['seconds'] = t
+        self.ops[name] = op
+
+    def run(self):
+        scene,n = self.scene,self.n_strips
+        strokes = scene.strokes(n)
+        ps = scene.polystrips()
+        self.polystrips = ps
+        k = max(1, n // 10)
+
+        # strips[i] = gedge created by stroke i (None if the stroke joined or split others)
+        strips = []
+        def insert():
+            for stroke in strokes:
+                n_gedges = len(ps.gedges)
+                ps.insert_gedge_from_stroke(stroke, False)
+                strips.append(ps.gedges[-1] if len(ps.gedges) == n_gedges+1 else None)
+            ps.remove_unconnected_gverts()
+            return len(strokes)
+        self.measure('insert_gedge_from_stroke', insert)
+
+        strips,radius = [ge for ge in strips if ge in ps.gedges],None
+        cols = max(1, len(strips) // 3)
+        ge_split  = strips[0:cols][:k]
+        ge_zip    = strips[cols:2*cols][:k]
+        ge_merge  = strips[2*cols:][:2*k]
+
+        gv_split = []
+        def split():
+            for ge in ge_split:
+                _,_,gv = ps.split_gedge_at_t(ge, 0.5)
+                gv_split.append(gv)
+            return len(ge_split)
+        self.measure('split_gedge_at_t', split)
+
+        def dissolve():
+            for gv in gv_split: ps.dissolve_gvert(gv)
+            ps.remove_unconnected_gverts()
+            return len(gv_split)
+        self.measure('dissolve_gvert', dissolve)
+
+        def zip_to():
+            count = 0
+            for ge in ge_zip:
+                # shorter, thinner strip running next to ge
+                p0,p1,p2,p3 = ge.get_positions()
+                r = ge.gvert0.radius
+                n0,n3 = ge.gvert0.snap_norm,ge.gvert3.snap_norm
+                side = (p3-p0).cross(n0+n3).normalized() * r * 1.5
+                stroke = [(ge.get_position_at_t(t) + side, r*0.5) for t in [0.2 + 0.6*i/29 for i in range(30)]]
+                n_gedges = len(ps.gedges)
+                ps.insert_gedge_from_stroke(stroke, False)
+                if len(ps.gedges) != n_gedges+1: continue
+                ps.gedges[-1].zip_to(ge)
+                count += 1
+            ps.remove_unconnected_gverts()
+            return count
+        self.measure('zip_to', zip_to)
+
+        def merge():
+            count = 0
+            for ge0,ge1 in zip(ge_merge[0::2], ge_merge[1::2]):
+                if ge0 not in ps.gedges or ge1 not in ps.gedges: continue
+                ps.merge_gverts(ge0.gvert3, ge1.gvert0)
+                count += 1
+            return count
+        self.measure('merge_gverts', merge)
+
+        mesh = []
+        def create_mesh():
+            mesh[:] = ps.create_mesh()
+            return 1
+        self.measure('create_mesh', create_mesh)
+
+        def create_mesh_buffers():
+            ps.create_mesh_buffers()
+            return 1
+        self.measure('create_mesh_buffers', create_mesh_buffers)
+        self.mesh_counts = (len(mesh[0]), len(mesh[1]))
+
+
+def bench(scene_name, n_strips, memory=True):
+    scene = Scene(scene_name)
+    timing = Run(scene, n_strips, False)
+    timing.run()
+    ps = timing.polystrips
+    result = {
+        'scene':  scene_name,
+        'strips': n_strips,
+        'gverts': len(ps.gverts),
+        'gedges': len(ps.gedges),
+        'verts':  timing.mesh_counts[0],
+        'quads':  timing.mesh_counts[1],
+        'orphans': ps.mesh_orphans,
+        'ops':    timing.ops,
+        }
+    if memory:
+        alloc = Run(scene, n_strips, True)
+        alloc.run()
+        for name,op in alloc.ops.items():
+            result['ops'][name]['alloc_blocks']  = op['alloc_blocks']
+            result['ops'][name]['alloc_peak_kb'] = op['alloc_peak_kb']
+    return result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='benchmark the polystrips core')
+    parser.add_argument('--scenes', nargs='+', default=['sphere','torus','head'])
+    parser.add_argument('--counts', nargs='+', type=int, default=[10,100,1000])
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write JSON to file instead of stdout')
+    args = parser.parse_args(argv)
+
+    results = []
+    for scene_name in args.scenes:
+        for n in args.counts:
+            results.append(bench(scene_name, n, memory=not args.no_memory))
+            sys.stderr.write('%s %i done\n' % (scene_name, n))
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f: f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    # blender passes its own arguments; ours come after '--'
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else sys.argv[1:]
+    main(argv)
@@ -0,0 +1,127 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# compares interval_count_for_length (closed form) against the linear search
+# it replaced in GEdge.update_nozip.  the corpus of (length, r0, r3) triples
+# is checked for identical counts first, then both are timed on it
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+# the addon modules import each other as top level modules
+path_here = os.path.dirname(os.path.abspath(__file__))
+for path in [path_here, os.path.dirname(path_here)]:
+    if path not in sys.path: sys.path.append(path)
+
+from polystrips_utilities import interval_count_for_length, interval_widths_total
+
+
+
+def interval_count_linear(l, r0, r3):
+    '''
+    the search of GEdge.update_nozip before interval_count_for_length
+    '''
+    cmin,cmax = int(math.floor(l/max(r0,r3))),int(math.floor(l/min(r0,r3)))
+    c = 0
+    for ctest in range(max(4,cmin-2),cmax+2):
+        s = (r3-r0) / (ctest-1)
+        tot = r0*(ctest+1) + s*(ctest+1)*ctest/2
+        if tot > l:
+            break
+        if ctest % 2 == 1:
+            c = ctest
+    return c
+
+def next_float(x, direction):
+    '''
+    closest float to x in direction (+1 or -1)
+    '''
+    if hasattr(math, 'nextafter'): return math.nextafter(x, direction*math.inf)
+    e = math.frexp(x)[1]
+    return x + direction * math.ldexp(1.0, e-53)
+
+def corpus(n, seed=0):
+    '''
+    returns list of (length, r0, r3) triples:
+        hand picked cases (tiny strips, equal radii, strongly tapered strips),
+        random strips with radii from 1/1000 to 1 of the length,
+        and lengths exactly at, and one float above and below, the total of some count
+    '''
+    rnd = random.Random(seed)
+    triples = [
+        (1.0, 1.0, 1.0), (1.0, 0.5, 0.5), (3.0, 0.5, 0.5), (4.9, 1.0, 1.0),
+        (10.0, 1.0, 1.0), (10.0, 0.1, 1.0), (10.0, 1.0, 0.1), (10.0, 0.01, 0.01),
+        (0.2, 0.01, 0.05), (2.5, 0.02, 0.02), (100.0, 0.05, 0.5), (100.0, 0.5, 0.05),
+        ]
+    for i in range(n):
+        l  = 10.0 ** rnd.uniform(-2, 2)
+        r0 = l * 10.0 ** rnd.uniform(-3, 0)
+        r3 = l * 10.0 ** rnd.uniform(-3, 0)
+        triples.append((l, r0, r3))
+    for i in range(n // 4):
+        r0 = 10.0 ** rnd.uniform(-3, 0)
+        r3 = r0 * 10.0 ** rnd.uniform(-1, 1)
+        l  = interval_widths_total(rnd.randint(4, 400), r0, r3)
+        triples += [(l, r0, r3), (next_float(l, 1), r0, r3), (next_float(l, -1), r0, r3)]
+    return triples
+
+def best_time(fn, triples, repeat):
+    best = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        for l,r0,r3 in triples: fn(l, r0, r3)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='interval count search: closed form vs linear')
+    parser.add_argument('--count', type=int, default=20000, help='random triples in corpus')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    triples = corpus(args.count)
+    bad = [(l,r0,r3) for l,r0,r3 in triples if interval_count_for_length(l,r0,r3) != interval_count_linear(l,r0,r3)]
+    print('corpus: %i triples, %i mismatches' % (len(triples), len(bad)))
+    for l,r0,r3 in bad[:10]:
+        print('    l=%r r0=%r r3=%r: %i != %i' % (l, r0, r3, interval_count_for_length(l,r0,r3), interval_count_linear(l,r0,r3)))
+    if bad: return 1
+
+    # split corpus by how many counts the linear search walks through
+    short = [t for t in triples if t[0]/min(t[1],t[2]) < 50]
+    long  = [t for t in triples if t[0]/min(t[1],t[2]) >= 50]
+    print('%10s %8s %12s %12s %8s' % ('strips', 'count', 'linear ms', 'closed ms', 'speedup'))
+    for name,lt in [('short', short), ('long', long), ('all', triples)]:
+        if not lt: continue
+        t0 = best_time(interval_count_linear, lt, args.repeat)
+        t1 = best_time(interval_count_for_length, lt, args.repeat)
+        print('%10s %8i %12.1f %12.1f %7.1fx' % (name, len(lt), t0*1000, t1*1000, t0/t1))
+    return 0
+
+if __name__ == '__main__':
+    # blender passes its own arguments; ours come after '--'
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,104 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# compares taking an undo snapshot with copy.deepcopy (old behavior) against
+# the copy-on-write snapshots of PolyStrips.snapshot()
+
+import os
+import sys
+import copy
+import time
+import tracemalloc
+
+# the addon modules import each other as top level modules
+path_here = os.path.dirname(os.path.abspath(__file__))
+for path in [path_here, os.path.dirname(path_here)]:
+    if path not in sys.path: sys.path.append(path)
+
+from polystrips_math import Vector
+
+from scenes import scene_polystrips
+
+
+
+def measure(fn, repeat=5):
+    '''
+    returns (best time in ms, bytes allocated and still alive after fn) of fn()
+    '''
+    best = None
+    keep = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        keep.append(fn())
+        t = (time.perf_counter() - t) * 1000.0
+        best = t if best is None else min(best, t)
+    del keep
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return (best, after - before)
+
+
+def grab_edit(polystrips):
+    '''
+    moves the first gvert a bit, like one step of the grab tool
+    '''
+    gv = polystrips.gverts[0]
+    with polystrips.batch_updates():
+        gv.position = gv.position + Vector((0.01,0.0,0.0))
+        gv.update()
+
+
+def run(counts=(10, 25, 50)):
+    print('%8s %8s %8s | %12s %12s | %12s %12s %12s' % (
+        'strips', 'gverts', 'gedges',
+        'deepcopy ms', 'deepcopy KB',
+        'snapshot ms', 'snapshot KB', 'edit KB'))
+    for n in counts:
+        polystrips = scene_polystrips('sphere', n)
+        polystrips.flush_updates()
+
+        t_deep,m_deep = measure(lambda: copy.deepcopy(polystrips))
+
+        polystrips.undo.clear()
+        t_snap,m_snap = measure(lambda: polystrips.snapshot())
+
+        # memory the newest snapshot holds after a typical edit
+        polystrips.undo.clear()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        polystrips.snapshot()
+        grab_edit(polystrips)
+        m_edit = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        print('%8i %8i %8i | %12.3f %12.1f | %12.3f %12.1f %12.1f' % (
+            n, len(polystrips.gverts), len(polystrips.gedges),
+            t_deep, m_deep/1024.0,
+            t_snap, m_snap/1024.0, m_edit/1024.0))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,153 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# procedural surfaces and scripted stroke sets for the benchmarks
+# each surface is a MeshSurfaceIndex plus a (u,v) parameterization used to lay
+# out strokes: u goes around (0..2pi), v runs between the surface's v range.
+# strokes stay on the half with u in 0..pi, as if sketched from one view
+# (picking a gvert tests a prism along its normal, which also reaches the far
+# side of a closed surface)
+
+import math
+import random
+
+from polystrips_math import Vector
+
+from polystrips_surface import MeshSurfaceIndex
+from polystrips import PolyStrips
+
+
+
+def uv_sphere(radius=1.0, segments=32, rings=16):
+    '''
+    returns (verts, faces) of a uv sphere
+    '''
+    verts = [(0,0,-radius)]
+    for j in range(1,rings):
+        lat = math.pi*j/rings - math.pi/2
+        for i in range(segments):
+            lon = 2*math.pi*i/segments
+            verts.append((radius*math.cos(lat)*math.cos(lon), radius*math.cos(lat)*math.sin(lon), radius*math.sin(lat)))
+    verts.append((0,0,radius))
+    i_top = len(verts)-1
+
+    def ring(j,i): return 1 + (j-1)*segments + (i%segments)
+
+    faces = []
+    for i in range(segments):
+        faces.append((0, ring(1,i+1), ring(1,i)))
+        faces.append((i_top, ring(rings-1,i), ring(rings-1,i+1)))
+    for j in range(1,rings-1):
+        for i in range(segments):
+            faces.append((ring(j,i), ring(j,i+1), ring(j+1,i+1), ring(j+1,i)))
+    return (verts, faces)
+
+
+def direction(lon, lat):
+    return Vector((math.cos(lat)*math.cos(lon), math.cos(lat)*math.sin(lon), math.sin(lat)))
+
+
+def head_point(d):
+    '''
+    maps unit direction d onto a head sized (~24cm tall), lumpy ellipsoid
+    '''
+    x,y,z = d
+    bump  = 0.06 * math.sin(5*x+1) * math.sin(4*y+2) * math.sin(3*z)
+    bump += 0.03 * math.sin(11*x + 7*z) * math.cos(9*y)
+    return Vector((0.075*x, 0.095*y, 0.12*z)) * (1.0 + bump)
+
+
+class Scene(object):
+    '''
+    procedural surface: name, MeshSurfaceIndex, point(u,v), v range, world length of one unit of v
+    '''
+    def __init__(self, name):
+        self.name = name
+        if name == 'sphere':
+            verts,faces = uv_sphere(1.0, 32, 16)
+            self.point  = lambda u,v: direction(u,v)
+            self.vrange = (-1.2, 1.2)
+            self.vscale = 1.0
+        elif name == 'torus':
+            R,r,nu,nv = 1.0,0.35,48,24
+            self.point  = lambda u,v: Vector(((R+r*math.cos(v))*math.cos(u), (R+r*math.cos(v))*math.sin(u), r*math.sin(v)))
+            verts = [tuple(self.point(2*math.pi*i/nu, 2*math.pi*j/nv)) for j in range(nv) for i in range(nu)]
+            faces = [(j*nu+i, j*nu+(i+1)%nu, ((j+1)%nv)*nu+(i+1)%nu, ((j+1)%nv)*nu+i) for j in range(nv) for i in range(nu)]
+            self.vrange = (-2.8, 2.8)
+            self.vscale = r
+        elif name == 'head':
+            verts,faces = uv_sphere(1.0, 48, 24)
+            verts = [tuple(head_point(Vector(v))) for v in verts]
+            self.point  = lambda u,v: head_point(direction(u,v))
+            self.vrange = (-1.2, 1.2)
+            self.vscale = 0.1
+        else:
+            assert False, 'unknown scene %s' % name
+        self.surface = MeshSurfaceIndex(verts, faces)
+
+    def layout(self, n_strips):
+        '''
+        returns (list of (u0,u1,v) for n_strips non-overlapping strips, stroke radius)
+        strips are laid out in rows of constant v, row by row
+        '''
+        cols = max(1, int(math.ceil(math.sqrt(n_strips/2.0))))
+        rows = int(math.ceil(n_strips / float(cols)))
+        v0,v1 = self.vrange
+        dv = (v1-v0) / rows
+        du = math.pi / cols
+        strips = []
+        for k in range(n_strips):
+            row,col = k // cols, k % cols
+            u0 = col*du + 0.15*du + 0.05*row
+            strips.append((u0, u0 + 0.7*du, v0 + (row+0.5)*dv))
+        return (strips, min(0.04, 0.3*dv) * self.vscale)
+
+    def stroke(self, u0, u1, v, radius, samples=30, seed=0):
+        '''
+        stroke from (u0,v) to (u1,v), as (position, radius) tuples
+        a little jitter keeps neighboring strokes from being exactly parallel
+        '''
+        rand = random.Random(seed)
+        stroke = []
+        for i in range(samples):
+            u = u0 + (u1-u0)*i/(samples-1)
+            stroke.append((self.point(u, v + rand.uniform(-0.002, 0.002)), radius))
+        return stroke
+
+    def strokes(self, n_strips):
+        strips,radius = self.layout(n_strips)
+        return [self.stroke(u0,u1,v, radius, seed=k) for k,(u0,u1,v) in enumerate(strips)]
+
+    def polystrips(self):
+        return PolyStrips(None, self.surface)
+
+
+def scene_polystrips(name, n_strips):
+    '''
+    PolyStrips on scene name with n_strips strips inserted
+    '''
+    scene = Scene(name)
+    polystrips = scene.polystrips()
+    for stroke in scene.strokes(n_strips):
+        polystrips.insert_gedge_from_stroke(stroke, False)
+    polystrips.remove_unconnected_gverts()
+    return polystrips
@@ -21,34 +21,33 @@ Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
 
 ####class definitions####
 
-import bpy
 import math
 from math import sin, cos
 import time
 import copy
-from mathutils import Vector, Quaternion
-from mathutils.geometry import intersect_point_line, intersect_line_plane
-from bpy_extras.view3d_utils import location_3d_to_region_2d, region_2d_to_vector_3d, region_2d_to_location_3d, region_2d_to_origin_3d
-import bmesh
-import blf, bgl
 import itertools
+from array import array
 
-from lib import common_utilities
-from lib.common_utilities import iter_running_sum, dprint, get_object_length_scale, profiler, AddonLocator,frange
-
+from polystrips_math import Vector, Quaternion, dprint, profiler, iter_running_sum, closest_t_and_distance_point_to_line_segment
 from polystrips_utilities import *
-from polystrips_draw import *
+from polystrips_surface import cross_normalized
+from polystrips_update import UpdateGraph, zip_order
+from polystrips_spatial import SpatialHash, boxes_of_points, boxes_overlap
+from polystrips_undo import UndoTracked, UndoJournal
+from polystrips_interval import IntervalStrip
 import polystrips_utilities
 
-#Make the addon name and location accessible
-AL = AddonLocator()
-
 
 
-class GVert:
-    def __init__(self, obj, length_scale, position, radius, normal, tangent_x, tangent_y):
+class GVert(UndoTracked):
+    def __init__(self, surface, length_scale, position, radius, normal, tangent_x, tangent_y, graph=None, snap=True):
+        '''
+        snap=False (needs graph) defers all surface queries to the next flush
+        of the update graph; until then position and corners are unsnapped
+        '''
         # store info
-        self.o_name       = obj.name
+        self.graph        = graph       # UpdateGraph; None for igverts
+        self.surface      = surface
         self.length_scale = length_scale
         
         self.position  = position
@@ -73,17 +72,20 @@ class GVert:
         self.zip_igv        = 0
         self.zip_snap_end   = False     # do we snap to endpoint of zip_over_gedge?
         
-        self.doing_update = False
-        
         self.visible = True
         
-        self.update()
+        if snap or graph is None:
+            self.update_snap()
+            self.update_corners()
+        else:
+            self.update_corners(snap=False)
+            graph.mark_gvert(self)
     
     def clone_detached(self):
         '''
         creates detached clone of gvert (without gedges)
         '''
-        gv = GVert(bpy.data.objects[self.o_name], self.length_scale, Vector(self.position), self.radius, Vector(self.normal), Vector(self.tangent_x), Vector(self.tangent_y))
+        gv = GVert(self.surface, self.length_scale, Vector(self.position), self.radius, Vector(self.normal), Vector(self.tangent_x), Vector(self.tangent_y), self.graph, snap=False)
         gv.snap_pos = Vector(self.snap_pos)
         gv.snap_norm = Vector(self.snap_norm)
         gv.snap_tanx = Vector(self.snap_tanx)
@@ -213,49 +215,43 @@ class GVert:
     def snap_corners(self):
         pr = profiler.start()
         
-        mx = bpy.data.objects[self.o_name].matrix_world
-        mx3x3 = mx.to_3x3()
-        imx = mx.inverted()
-        
-        self.corner0 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*self.corner0)[0]
-        self.corner1 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*self.corner1)[0]
-        self.corner2 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*self.corner2)[0]
-        self.corner3 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*self.corner3)[0]
+        lc = self.surface.closest_points([self.corner0, self.corner1, self.corner2, self.corner3])
+        self.corner0,self.corner1,self.corner2,self.corner3 = [l for l,n,i in lc]
         
         pr.done()
     
     def update(self, do_edges=True):
-        if self.doing_update: return
-        
-        if self.zip_over_gedge and do_edges:
-            self.zip_over_gedge.update()
+        '''
+        marks gvert dirty and flushes the update graph, which recomputes
+        gvert and everything depending on it exactly once
+        do_edges=False (or no graph) recomputes only this gvert, immediately
+        '''
+        if not do_edges or not self.graph:
+            self.update_snap()
+            self.update_corners()
             return
-        
+        self.graph.mark_gvert(self)
+        self.graph.flush()
+    
+    def update_snap(self):
         pr = profiler.start()
         
-        mx = bpy.data.objects[self.o_name].matrix_world
-        mxnorm = mx.transposed().inverted().to_3x3()
-        mx3x3 = mx.to_3x3()
-        imx = mx.inverted()
-        
-        l,n,i = bpy.data.objects[self.o_name].closest_point_on_mesh(imx*self.position)
-        self.snap_norm = (mxnorm * n).normalized()
+        l,n,i = self.surface.closest_point(self.position)
+        self.snap_norm = n
         self.snap_tanx = self.tangent_x.normalized()
         self.snap_tany = self.snap_norm.cross(self.snap_tanx).normalized()
         
         if not self.is_unconnected() or True:
-            self.snap_pos  = mx * l
+            self.snap_pos  = l
             self.position = self.snap_pos
         else:
             self.snap_pos = self.position
         # NOTE! DO NOT UPDATE NORMAL, TANGENT_X, AND TANGENT_Y
         
-        if do_edges:
-            self.doing_update = True
-            for gedge in [self.gedge0,self.gedge1,self.gedge2,self.gedge3]:
-                if gedge: gedge.update()
-            if self.gedge_inner: self.gedge_inner.update()
-            self.doing_update = False
+        pr.done()
+    
+    def update_corners(self, snap=True):
+        pr = profiler.start()
         
         self.snap_tanx = (Vector((0.2,0.1,0.5)) if not self.gedge0 else self.gedge0.get_derivative_at(self)).normalized()
         self.snap_tany = self.snap_norm.cross(self.snap_tanx).normalized()
@@ -300,7 +296,7 @@ class GVert:
             self.corner2 = get_corner(self,-1,-1, igv2,r2, igv1,r1)
             self.corner3 = get_corner(self,-1, 1, igv3,r3, igv2,r2)
         
-        self.snap_corners()
+        if snap: self.snap_corners()
         
         pr.done()
     
@@ -329,7 +325,7 @@ class GVert:
             assert False
     
     def update_visibility(self, r3d, update_gedges=False):
-        self.visible = common_utilities.ray_cast_visible([self.snap_pos], bpy.data.objects[self.o_name], r3d)[0]
+        self.visible = self.surface.ray_cast_visible([self.snap_pos], r3d)[0]
         if not update_gedges: return
         for ge in self.get_gedges_notnone():
             ge.update_visibility(r3d)
@@ -469,13 +465,14 @@ class GVert:
         pr.done()
 
 
-class GEdge:
+class GEdge(UndoTracked):
     '''
     Graph Edge (GEdge) stores end points and "way points" (cubic bezier)
     '''
-    def __init__(self, obj, length_scale, gvert0, gvert1, gvert2, gvert3):
+    def __init__(self, surface, length_scale, gvert0, gvert1, gvert2, gvert3):
         # store end gvertices
-        self.o_name = obj.name
+        self.graph = gvert0.graph
+        self.surface = surface
         self.length_scale = length_scale
         self.gvert0 = gvert0
         self.gvert1 = gvert1
@@ -492,9 +489,10 @@ class GEdge:
         self.zip_attached   = []
         
         # create caching vars
-        self.cache_igverts = []             # cached interval gverts
-                                            # even-indexed igverts are poly "centers"
-                                            #  odd-indexed igverts are poly "edges"
+        self.nozip_memo = None              # (inputs, cache_igverts, n_quads) of last update_nozip
+        self.cache_igverts = IntervalStrip()    # cached interval gverts
+                                                # even-indexed igverts are poly "centers"
+                                                #  odd-indexed igverts are poly "edges"
         
         gvert0.connect_gedge(self)
         gvert1.connect_gedge_inner(self)
@@ -508,7 +506,7 @@ class GEdge:
         assert not self.zip_to_gedge
         
         self.zip_to_gedge = gedge
-        gedge.zip_attached += [self]
+        gedge.zip_attached = gedge.zip_attached + [self]
         
         t0,_ = gedge.get_closest_point(self.gvert0.position)
         t3,_ = gedge.get_closest_point(self.gvert3.position)
@@ -563,9 +561,8 @@ class GEdge:
         self.gvert3.disconnect_gedge(self)
     
     def update_visibility(self, rv3d):
-        lp = [gv.snap_pos for gv in self.cache_igverts]
-        lv = common_utilities.ray_cast_visible(lp, bpy.data.objects[self.o_name], rv3d)
-        for gv,v in zip(self.cache_igverts,lv): gv.visible = v
+        strip = self.cache_igverts
+        strip.visible = list(self.surface.ray_cast_visible(strip.positions, rv3d))
     
     def gverts(self):
         return [self.gvert0,self.gvert1,self.gvert2,self.gvert3]
@@ -646,10 +643,8 @@ class GEdge:
     
     def get_length(self, precision = 64):
         p0,p1,p2,p3 = self.get_positions()
-        mx = bpy.data.objects[self.o_name].matrix_world
-        imx = mx.inverted()
-        p3d = [cubic_bezier_blend_t(p0,p1,p2,p3,t/precision) for t in range(precision+1)]
-        p3d = [mx*bpy.data.objects[self.o_name].closest_point_on_mesh(imx * p)[0] for p in p3d]
+        p3d = cubic_bezier_blend_ts(p0,p1,p2,p3, [t/precision for t in range(precision+1)])
+        p3d = [l for l,n,i in self.surface.closest_points(p3d)]
         return sum((p1-p0).length for p0,p1 in zip(p3d[:-1],p3d[1:]))
         #return cubic_bezier_length(p0,p1,p2,p3)
     
@@ -658,10 +653,10 @@ class GEdge:
         if len(self.cache_igverts) < 3:
             return cubic_bezier_find_closest_t_approx(p0,p1,p2,p3,pt)
         min_t,min_d = -1,-1
-        i,l = 0,len(self.cache_igverts)
-        for gv0,gv1 in zip(self.cache_igverts[:-1],self.cache_igverts[1:]):
-            p0,p1 = gv0.position,gv1.position
-            t,d = common_utilities.closest_t_and_distance_point_to_line_segment(pt, p0,p1)
+        lp = self.cache_igverts.positions
+        i,l = 0,len(lp)
+        for p0,p1 in zip(lp[:-1],lp[1:]):
+            t,d = closest_t_and_distance_point_to_line_segment(pt, p0,p1)
             if min_t < 0 or d < min_d: min_t,min_d = (i+t)/l,d
             i += 1
         return min_t,min_d
@@ -675,8 +670,9 @@ class GEdge:
         extend off of igverts of self.zip_to_gedge
         '''
         
-        zip_igverts = self.zip_to_gedge.cache_igverts
-        l = len(zip_igverts)
+        zip_strip = self.zip_to_gedge.cache_igverts
+        zpos,znorm,ztanx,ztany,zrad = zip_strip.positions,zip_strip.normals,zip_strip.tangent_xs,zip_strip.tangent_ys,zip_strip.radii
+        l = len(zip_strip)
         
         t0 = self.gvert0.zip_t
         t3 = self.gvert3.zip_t
@@ -690,41 +686,42 @@ class GEdge:
         
         if i0 == i3:
             dprint('i0 == i3')
-            self.cache_igverts = []
+            self.cache_igverts = IntervalStrip()
             
         else:
             if i0 < i3:
                 ic = (i3-i0)+1
-                if i3>len(zip_igverts):
+                if i3>l:
                     dprint('%i %i %i' % (i0,i3,ic))
-                loigv = [zip_igverts[i0+_i] for _i in range(ic)]
+                linds = [i0+_i for _i in range(ic)]
             elif i3 < i0:
                 ic = (i0-i3)+1
-                if i0>len(zip_igverts):
+                if i0>l:
                     dprint('%i %i %i' % (i3,i0,ic))
-                loigv = [zip_igverts[i3+_i] for _i in range(ic)]
-                loigv.reverse()
+                linds = [i3+_i for _i in range(ic)]
+                linds.reverse()
             
             side = self.zip_side
             zdir = self.zip_dir
             
             r0,r3   = self.gvert0.radius,self.gvert3.radius
             rm      = (r3-r0)/float(ic+2)
-            l_radii = [r0+rm*(_i+1)        for _i,oigv in enumerate(loigv)]
-            l_pos   = [oigv.position+oigv.tangent_y*side*(oigv.radius+l_radii[_i]) for _i,oigv in enumerate(loigv)]
-            l_norms = [oigv.normal         for _i,oigv in enumerate(loigv)]
-            l_tanx  = [oigv.tangent_x*zdir for _i,oigv in enumerate(loigv)]
-            l_tany  = [oigv.tangent_y*zdir for _i,oigv in enumerate(loigv)]
+            l_radii = [r0+rm*(_i+1)  for _i,i in enumerate(linds)]
+            l_pos   = [zpos[i]+ztany[i]*side*(zrad[i]+l_radii[_i]) for _i,i in enumerate(linds)]
+            l_norms = [znorm[i]      for i in linds]
+            l_tanx  = [ztanx[i]*zdir for i in linds]
+            l_tany  = [ztany[i]*zdir for i in linds]
             
-            self.cache_igverts = [GVert(bpy.data.objects[self.o_name],self.length_scale,p,r,n,tx,ty) for p,r,n,tx,ty in zip(l_pos,l_radii,l_norms,l_tanx,l_tany)]
+            self.cache_igverts = IntervalStrip(l_pos, l_norms, l_tanx, l_tany, l_radii)
             self.snap_igverts()
             
-            assert len(self.cache_igverts)>=2, 'not enough! %i (%f) %i (%f) %i' % (i0,t0,i3,t3,ic)
+            lp = self.cache_igverts.positions
+            assert len(lp)>=2, 'not enough! %i (%f) %i (%f) %i' % (i0,t0,i3,t3,ic)
             
-            self.gvert0.position = self.cache_igverts[0].position
-            self.gvert1.position = (self.cache_igverts[0].position+self.cache_igverts[-1].position)/2
-            self.gvert2.position = (self.cache_igverts[0].position+self.cache_igverts[-1].position)/2
-            self.gvert3.position = self.cache_igverts[-1].position
+            self.gvert0.position = lp[0]
+            self.gvert1.position = (lp[0]+lp[-1])/2
+            self.gvert2.position = (lp[0]+lp[-1])/2
+            self.gvert3.position = lp[-1]
             
             def get_corners(ind, radius):
                 if ind == -1:
@@ -732,15 +729,14 @@ class GEdge:
                     if side<0:  p0,p1 = p0,p0+(p0-p1).normalized()*(radius*2)
                     else:       p0,p1 = p1,p1+(p1-p0).normalized()*(radius*2)
                     return (p1,p0)
-                if ind == len(zip_igverts):
+                if ind == l:
                     p0,p1 = self.zip_to_gedge.gvert3.get_back_corners_of(self.zip_to_gedge)
                     if side>0:  p0,p1 = p0,p0+(p0-p1).normalized()*(radius*2)
                     else:       p0,p1 = p1,p1+(p1-p0).normalized()*(radius*2)
                     return (p1,p0)
                 
-                igv = zip_igverts[ind]
-                p0 = igv.position + igv.tangent_y*side*(igv.radius+radius*2)
-                p1 = igv.position + igv.tangent_y*side*(igv.radius)
+                p0 = zpos[ind] + ztany[ind]*side*(zrad[ind]+radius*2)
+                p1 = zpos[ind] + ztany[ind]*side*(zrad[ind])
                 return (p0,p1)
             
             if i0 < i3:
@@ -769,31 +765,27 @@ class GEdge:
         self.gvert1.update(do_edges=False)
         self.gvert2.update(do_edges=False)
         self.gvert3.update(do_edges=False)
-        
-        for ge in self.gvert0.get_gedges_notnone()+self.gvert3.get_gedges_notnone():
-            if ge != self: ge.update(debug=debug)
     
     def update_nozip(self, debug=False):
         p0,p1,p2,p3 = self.get_positions()
         r0,r1,r2,r3 = self.get_radii()
         n0,n1,n2,n3 = self.get_normals()
         
+        # the igverts depend only on these, so a cascaded update of an unchanged gedge is free
+        key = (tuple(tuple(v) for v in (p0,p1,p2,p3,n0,n1,n2,n3)), r0, r3, self.n_quads, self.force_count, self.surface.xform.serial)
+        if self.nozip_memo and self.nozip_memo[0] == key:
+            _,self.cache_igverts,self.n_quads = self.nozip_memo
+            return
+        
         if False:
             # attempting to smooth snapped igverts
-            mx     = self.obj.matrix_world
-            mxnorm = mx.transposed().inverted().to_3x3()
-            mx3x3  = mx.to_3x3()
-            imx    = mx.inverted()
-            p3d      = [cubic_bezier_blend_t(p0,p1,p2,p3,t/16.0) for t in range(17)]
-            snap     = [self.obj.closest_point_on_mesh(imx*p) for p in p3d]
-            snap_pos = [mx*pos for pos,norm,idx in snap]
+            p3d      = cubic_bezier_blend_ts(p0,p1,p2,p3, [t/16.0 for t in range(17)])
+            snap_pos = [pos for pos,norm,idx in self.surface.closest_points(p3d)]
             bez = cubic_bezier_fit_points(snap_pos, min(r0,r3)/20, allow_split=False)
             if bez:
                 _,_,p0,p1,p2,p3 = bez[0]
-                _,n1,_ = self.obj.closest_point_on_mesh(imx*p1)
-                _,n2,_ = self.obj.closest_point_on_mesh(imx*p2)
-                n1 = mxnorm*n1
-                n2 = mxnorm*n2
+                _,n1,_ = self.surface.closest_point(p1)
+                _,n2,_ = self.surface.closest_point(p2)
         
         #get s_t_map
         if self.n_quads:
@@ -804,7 +796,7 @@ class GEdge:
         s_t_map = polystrips_utilities.cubic_bezier_t_of_s_dynamic(p0, p1, p2, p3, initial_step = step )
         
         #l = self.get_length()  <-this is more accurate, but we need consistency
-        l = max(s_t_map)
+        l = s_t_map.length
         
         if self.force_count and self.n_quads:
             # force number of segments
@@ -821,24 +813,16 @@ class GEdge:
             
             # compute interval lengths and ts
             l_widths = [0] + [r0 + s*i - d_os for i in range(c)]
-            l_ts = [polystrips_utilities.closest_t_of_s(s_t_map, dist) for w,dist in iter_running_sum(l_widths)]  #pure lenght distribution
+            l_ts = s_t_map.t_of_s([dist for w,dist in iter_running_sum(l_widths)])  #pure lenght distribution
         
         else:
             # find "optimal" count for subdividing spline based on radii of two endpoints
             
-            cmin,cmax = int(math.floor(l/max(r0,r3))),int(math.floor(l/min(r0,r3)))
-            
-            c = 0
-            for ctest in range(max(4,cmin-2),cmax+2):
-                s = (r3-r0) / (ctest-1)
-                tot = r0*(ctest+1) + s*(ctest+1)*ctest/2
-                if tot > l:
-                    break
-                if ctest % 2 == 1:
-                    c = ctest
+            c = interval_count_for_length(l, r0, r3)
             if c <= 1:
-                self.cache_igverts = []
+                self.cache_igverts = IntervalStrip()
                 self.n_quads = 3
+                self.nozip_memo = (key, self.cache_igverts, self.n_quads)
                 return
             
             # compute difference for smoothly interpolating radii
@@ -854,62 +838,70 @@ class GEdge:
             l_ts = [p/l for w,p in iter_running_sum(l_widths)]
         
         # compute interval pos, rad, norm, tangent x, tangent y
-        l_pos   = [cubic_bezier_blend_t(p0,p1,p2,p3,t) for t in l_ts]
-        l_radii = [r0 + i*s for i in range(c+2)]
+        l_pos,l_der,l_norms = cubic_bezier_eval(p0,p1,p2,p3, l_ts, normals=(n0,n1,n2,n3))
+        l_radii = [r0 + i*s for i in range(len(l_ts))]
         
         #Verify smooth radius interpolation
         #print('R0 %f, R3 %f, r0 %f, r3 %f ' % (r0,r3,l_radii[0],l_radii[-1]))
-        l_norms = [cubic_bezier_blend_t(n0,n1,n2,n3,t).normalized() for t in l_ts]
-        l_tanx  = [cubic_bezier_derivative(p0,p1,p2,p3,t).normalized() for t in l_ts]
-        l_tany  = [t.cross(n).normalized() for t,n in zip(l_tanx,l_norms)]
+        l_tanx  = [d.normalized() for d in l_der]
+        l_tany  = cross_normalized(l_tanx, l_norms)
         
         # create igverts!
-        self.cache_igverts = [GVert(bpy.data.objects[self.o_name],self.length_scale,p,r,n,tx,ty) for p,r,n,tx,ty in zip(l_pos,l_radii,l_norms,l_tanx,l_tany)]
+        self.cache_igverts = IntervalStrip(l_pos, l_norms, l_tanx, l_tany, l_radii)
         if not self.force_count:
             self.n_quads = int((len(self.cache_igverts)+1)/2)
             
         
         self.snap_igverts()
+        self.nozip_memo = (key, self.cache_igverts, self.n_quads)
         
-        self.gvert0.update(do_edges=False)
-        self.gvert1.update(do_edges=False)
-        self.gvert2.update(do_edges=False)
-        self.gvert3.update(do_edges=False)
+        # corners of gverts are recomputed by the update graph
         
     
     def update(self, debug=False):
+        '''
+        marks gedge dirty and flushes the update graph, which recomputes
+        gedge and everything depending on it exactly once
+        '''
+        self.graph.mark_gedge(self)
+        self.graph.flush()
+    
+    def update_igverts(self, debug=False):
         '''
         recomputes interval gverts along gedge
         note: considering only the radii of end points
         note: approx => not snapped to surface
         '''
-        
         if self.zip_to_gedge:
             self.update_zip(debug=debug)
         else:
             self.update_nozip(debug=debug)
         
-        for zgedge in self.zip_attached:
-            zgedge.update(debug=debug)
-        
     def snap_igverts(self):
         '''
         snaps already computed igverts to surface of object ob
         '''
-        mx = bpy.data.objects[self.o_name].matrix_world
-        mxnorm = mx.transposed().inverted().to_3x3()
-        mx3x3 = mx.to_3x3()
-        imx = mx.inverted()
-        
-        for igv in self.cache_igverts:
-            l,n,i = bpy.data.objects[self.o_name].closest_point_on_mesh(imx * igv.position)
-            igv.position = mx * l
-            igv.normal = (mxnorm * n).normalized()
-            igv.tangent_y = igv.normal.cross(igv.tangent_x).normalized()
-            igv.snap_pos = igv.position
-            igv.snap_norm = igv.normal
-            igv.snap_tanx = igv.tangent_x
-            igv.snap_tany = igv.tangent_y
+        strip = self.cache_igverts
+        ll,ln,li = self.surface.snap_points(strip.positions)
+        strip.positions  = list(ll)
+        strip.normals    = list(ln)
+        strip.tangent_ys = list(cross_normalized(ln, strip.tangent_xs))
+        self.snap_rails()
+    
+    def snap_rails(self):
+        '''
+        snaps side points of the odd igverts between the end gverts to surface, in one batch
+        drawing, picking and create_mesh all use these, so none of them queries the surface
+        '''
+        strip = self.cache_igverts
+        l = len(strip)
+        lpos,ltany,lrad = strip.positions,strip.tangent_ys,strip.radii
+        side_inds = [i for i in range(3,l,2) if i != l-2]
+        lp = [lpos[i]+sgn*ltany[i]*lrad[i] for i in side_inds for sgn in (1,-1)]
+        if lp: lp = self.surface.snap_points(lp)[0]
+        strip.rail_pos,strip.rail_neg = [None]*l,[None]*l
+        for j,i in enumerate(side_inds):
+            strip.rail_pos[i],strip.rail_neg[i] = lp[2*j],lp[2*j+1]
         
     
     def is_picked(self, pt):
@@ -922,50 +914,161 @@ class GEdge:
         return False
     
     def iter_segments(self, only_visible=False):
-        l = len(self.cache_igverts)
+        vis = self.cache_igverts.visible
+        for segment,i in self.iter_segments_indexed():
+            if only_visible:
+                if i is None:
+                    if not (self.gvert0.is_visible() and self.gvert3.is_visible()): continue
+                elif not vis[i]: continue
+            yield segment
+    
+    def iter_segments_gverts(self):
+        '''
+        yields (corners of segment, gverts that must be visible for the segment to be visible)
+        igverts are given as IntervalVerts
+        '''
+        strip = self.cache_igverts
+        for segment,i in self.iter_segments_indexed():
+            yield (segment, (self.gvert0,self.gvert3) if i is None else (strip[i],))
+    
+    def iter_segments_indexed(self):
+        '''
+        yields (corners of segment, index of igvert that must be visible for the segment to be visible)
+        index is None if gedge has no igverts (gvert0 and gvert3 must be visible)
+        '''
+        strip = self.cache_igverts
+        l = len(strip)
         if l == 0:
             cur0,cur1 = self.gvert0.get_corners_of(self)
             cur2,cur3 = self.gvert3.get_corners_of(self)
-            if not only_visible or (self.gvert0.is_visible() and self.gvert3.is_visible()):
-                yield (cur0,cur1,cur2,cur3)
+            yield ((cur0,cur1,cur2,cur3), None)
             return
         
+        rail_pos,rail_neg = strip.rail_pos,strip.rail_neg
         prev0,prev1 = None,None
-        for i,gvert in enumerate(self.cache_igverts):
-            if i%2 == 0: continue
-            
+        for i in range(1, l, 2):
             if i == 1:
-                gv0 = self.gvert0
-                cur0,cur1 = gv0.get_corners_of(self)
+                cur0,cur1 = self.gvert0.get_corners_of(self)
             elif i == l-2:
-                gv3 = self.gvert3
-                cur1,cur0 = gv3.get_corners_of(self)
+                cur1,cur0 = self.gvert3.get_corners_of(self)
             else:
-                cur0 = gvert.position+gvert.tangent_y*gvert.radius
-                cur1 = gvert.position-gvert.tangent_y*gvert.radius
+                cur0,cur1 = rail_pos[i],rail_neg[i]
             
-            if prev0 and prev1:
-                if not only_visible or gvert.is_visible():
-                    yield (prev0,cur0,cur1,prev1)
+            if prev0 is not None:
+                yield ((prev0,cur0,cur1,prev1), i)
             prev0,prev1 = cur0,cur1
 
 
 class PolyStrips(object):
-    def __init__(self, context, obj):
-        settings = common_utilities.get_settings()
-        
-        self.o_name = obj.name
-        self.length_scale = get_object_length_scale(bpy.data.objects[self.o_name])
+    def __init__(self, context, surface):
+        self.surface = surface
+        self.xform = surface.xform      # TransformContext of the source object
+        self.length_scale = surface.length_scale
         
         # graph vertices and edges
         self.gverts = []
         self.gedges = []
         
+        # dirty tracking / incremental recompute of gverts and gedges
+        self.graph = UpdateGraph()
+        
+        # copy-on-write undo snapshots
+        self.undo = UndoJournal()
+        self.graph.journal = self.undo
+        
+        # grid over gvert corners and gedge segments, for picking
+        self.spatial = SpatialHash(self.length_scale / 50.0)
+        self.spatial_stale = []         # recomputed gverts/gedges to re-index before next pick
+        self.graph.add_listener(self.update_spatial)
+        
+        # stroke segment vs gedge side segment tests when inserting strokes
+        self.crossing_tests = 0         # exact tests (line_segment_intersection) run
+        self.crossing_tests_skipped = 0 # pairs culled by bounding boxes
+        
+        # verts built by the last create_mesh but used by no quad
+        self.mesh_orphans = 0
+    
+    def flush_updates(self):
+        '''
+        recomputes all dirty gverts and gedges
+        '''
+        self.graph.flush()
+    
+    def batch_updates(self):
+        '''
+        with polystrips.batch_updates(): ...
+        defers recomputing until the block is done, so each item is recomputed once
+        '''
+        return self.graph.batch()
+    
+    def snapshot(self):
+        '''
+        takes an undo snapshot; only gverts/gedges changed afterwards are copied
+        '''
+        self.flush_updates()
+        return self.undo.snapshot(self.gverts, self.gedges)
+    
+    def restore_snapshot(self, snap):
+        '''
+        restores state at snap (must be the newest snapshot)
+        '''
+        lobjs = self.undo.restore(snap)
+        cur = set(self.gverts) | set(self.gedges)
+        self.gverts = list(snap.gverts)
+        self.gedges = list(snap.gedges)
+        new = set(self.gverts) | set(self.gedges)
+        
+        self.graph.dirty_gverts,self.graph.dirty_gedges = [],[]
+        for item in cur - new: self.forget_spatial(item)
+        changed = [item for item in lobjs + [item for item in self.gverts + self.gedges if item not in cur] if item in new]
+        self.graph.notify([gv for gv in changed if isinstance(gv, GVert)], [ge for ge in changed if isinstance(ge, GEdge)])
+    
+    def index_gvert(self, gvert):
+        pts = [gvert.snap_pos] + list(gvert.get_corners())
+        self.spatial.insert(gvert, boxes_of_points([pts], gvert.radius))
+    
+    def index_gedge(self, gedge):
+        margin = max(gedge.gvert0.radius, gedge.gvert3.radius)
+        self.spatial.insert(gedge, boxes_of_points(list(gedge.iter_segments()), margin))
+    
+    def update_spatial(self, gverts, gedges):
+        '''
+        update graph listener: everything recomputed is re-indexed before the
+        next pick (a gedge may still be half connected while it is being built)
+        '''
+        for item in gedges + [gv for ge in gedges for gv in ge.gverts()] + gverts:
+            if item not in self.spatial_stale: self.spatial_stale.append(item)
+    
+    def sync_spatial(self):
+        for item in self.spatial_stale:
+            if isinstance(item, GEdge): self.index_gedge(item)
+            else: self.index_gvert(item)
+        self.spatial_stale = []
+    
+    def pick_gverts(self, pt):
+        '''
+        returns gverts picked at pt, in order of self.gverts
+        '''
+        self.sync_spatial()
+        return [gv for gv in self.spatial.query(pt) if isinstance(gv, GVert) and gv.is_picked(pt)]
+    
+    def pick_gedges(self, pt):
+        '''
+        returns gedges picked at pt, in order of self.gedges
+        '''
+        self.sync_spatial()
+        return [ge for ge in self.spatial.query(pt) if isinstance(ge, GEdge) and ge.is_picked(pt)]
+    
+    def forget_spatial(self, item):
+        self.spatial.remove(item)
+        self.spatial_stale = [i for i in self.spatial_stale if i != item]
     
     def disconnect_gedge(self, gedge):
         assert gedge in self.gedges
         gedge.disconnect()
         self.gedges = [ge for ge in self.gedges if ge != gedge]
+        self.graph.discard(gedge)
+        self.forget_spatial(gedge)
     
     def disconnect_gvert(self, gvert):
         assert gvert in self.gverts
@@ -978,20 +1081,28 @@ class PolyStrips(object):
         egvs = set(gv for gedge in self.gedges for gv in gedge.gverts())
         gvs = set(gv for gv in self.gverts if gv.is_unconnected() and gv not in egvs)
         self.gverts = [gv for gv in self.gverts if gv not in gvs]
+        for gv in gvs:
+            self.graph.discard(gv)
+            self.forget_spatial(gv)
     
-    def create_gvert(self, co, radius=0.005):
+    def create_gvert(self, co, radius=0.005, snap=True):
+        '''
+        snap=False defers snapping the new gvert to the next flush (see GVert);
+        use it when the gvert goes straight into create_gedge
+        '''
         #if type(co) is not Vector: co = Vector(co)
         p0  = co
         r0  = radius
         n0  = Vector((0,0,1))
         tx0 = Vector((1,0,0))
         ty0 = Vector((0,1,0))
-        gv = GVert(bpy.data.objects[self.o_name],self.length_scale,p0,r0,n0,tx0,ty0)
+        gv = GVert(self.surface,self.length_scale,p0,r0,n0,tx0,ty0,self.graph,snap=snap)
         self.gverts += [gv]
+        self.index_gvert(gv)
         return gv
     
     def create_gedge(self, gv0, gv1, gv2, gv3):
-        ge = GEdge(bpy.data.objects[self.o_name], self.length_scale, gv0, gv1, gv2, gv3)
+        ge = GEdge(self.surface, self.length_scale, gv0, gv1, gv2, gv3)
         ge.update()
         self.gedges += [ge]
         return ge
@@ -1023,19 +1134,20 @@ class PolyStrips(object):
             gv_split = connect_gvert
             trans = cb0[3] - gv_split.position
             for ge in gv_split.get_gedges_notnone():
-                ge.get_inner_gvert_at(gv_split).position += trans
-            gv_split.position += trans
+                gv = ge.get_inner_gvert_at(gv_split)
+                gv.position = gv.position + trans
+            gv_split.position = gv_split.position + trans
         else:
-            gv_split = self.create_gvert(cb0[3], radius=rm)
+            gv_split = self.create_gvert(cb0[3], radius=rm, snap=False)
         
         gv0_0 = gedge.gvert0
-        gv0_1 = self.create_gvert(cb0[1], radius=rm)
-        gv0_2 = self.create_gvert(cb0[2], radius=rm)
+        gv0_1 = self.create_gvert(cb0[1], radius=rm, snap=False)
+        gv0_2 = self.create_gvert(cb0[2], radius=rm, snap=False)
         gv0_3 = gv_split
         
         gv1_0 = gv_split
-        gv1_1 = self.create_gvert(cb1[1], radius=rm)
-        gv1_2 = self.create_gvert(cb1[2], radius=rm)
+        gv1_1 = self.create_gvert(cb1[1], radius=rm, snap=False)
+        gv1_2 = self.create_gvert(cb1[2], radius=rm, snap=False)
         gv1_3 = gedge.gvert3
         
         # want to *replace* gedge with new gedges
@@ -1058,11 +1170,12 @@ class PolyStrips(object):
         
         return (ge0,ge1,gv_split)
     
-    def insert_gedge_from_stroke(self, stroke, only_ends, sgv0=None, sgv3=None, depth=0):
+    def insert_gedge_from_stroke(self, stroke, only_ends, sgv0=None, sgv3=None, depth=0, crossings=None):
         '''
         stroke: list of tuples (3d location, radius)
         yikes....pressure and radius need to be reconciled!
         for now, assumes 
+        crossings: self intersections of stroke (stroke_self_intersections), if already known
         '''
         
         assert depth < 10
@@ -1073,22 +1186,13 @@ class PolyStrips(object):
         if len(stroke) <= 1:
             dprint(spc+'Too few samples in stroke to subsample')
             return
-        # uniform subsampling
-        while len(stroke) <= 40:
-            stroke = [stroke[0]] + [nptpr for ptpr0,ptpr1 in zip(stroke[:-1],stroke[1:]) for nptpr in [((ptpr0[0]+ptpr1[0])/2,(ptpr0[1]+ptpr1[1])/2), ptpr1]]
-        # non-uniform/detail subsampling
-        done = False
-        while not done:
-            done = True
-            nstroke = [stroke[0]]
-            for ptpr0,ptpr1 in zip(stroke[:-1],stroke[1:]):
-                pt0,pr0 = ptpr0
-                pt1,pr1 = ptpr1
-                if (pt0-pt1).length > (pr0+pr1)/20:
-                    nstroke += [((pt0+pt1)/2, (pr0+pr1)/2)]
-                nstroke += [ptpr1]
-            done = (len(stroke) == len(nstroke))
-            stroke = nstroke
+        # subsample stroke (uniformly, to more than 40 samples, and then to spacing of (r0+r1)/20)
+        n_samples = len(stroke)
+        resampler = StrokeResampler(20.0, StrokeResampler.min_subdivisions_for(n_samples, 40))
+        stroke = list(resampler.resample(stroke))
+        if len(stroke) != n_samples:
+            # known crossings are indexed by the original samples
+            crossings = None
         
         if sgv0 and sgv0==sgv3 and sgv0.count_gedges() >= 3:
             dprint(spc+'cannot connect stroke to same gvert (too many gedges)')
@@ -1108,27 +1212,9 @@ class PolyStrips(object):
         
         
         # self intersection test
-        min_i0,min_i1,min_dist = -1,-1,float('inf')
-        for i0,info0 in enumerate(stroke):
-            pt0,pr0 = info0
-            # find where we start to be far enough away
-            i1 = i0+1
-            while i1 < len(stroke):
-                pt1,pr1 = stroke[i1]
-                if (pt0-pt1).length > (pr0+pr1): break
-                i1 += 1
-            while i1 < len(stroke):
-                pt1,pr1 = stroke[i1]
-                d = (pt0-pt1).length - min(pr0,pr1)
-                if d < min_dist:
-                    min_i0 = i0
-                    min_i1 = i1
-                    min_dist = d
-                i1 += 1
-        
-        if min_dist < 0:
-            i0 = min_i0
-            i1 = min_i1
+        if crossings is None: crossings = stroke_self_intersections(stroke)
+        if crossings:
+            i0,i1 = crossings[0]
             
             pt0,pr0 = stroke[i0]
             pt1,pr1 = stroke[i1]
@@ -1141,6 +1227,9 @@ class PolyStrips(object):
                     if not gv_intersect.is_picked(stroke[i][0]): return i
                     i += i_direction
                 return -1
+            def crossings_in(i_start, i_end):
+                # remaining crossings inside stroke[i_start:i_end], reindexed
+                return [(j0-i_start,j1-i_start) for j0,j1 in crossings[1:] if j0 >= i_start and j1 < i_end]
             i00 = find_not_picking(i0,-1)
             i01 = find_not_picking(i0, 1)
             i10 = find_not_picking(i1,-1)
@@ -1148,13 +1237,13 @@ class PolyStrips(object):
             dprint(spc+'stroke self intersection %i,%i => %i,%i,%i,%i' % (i0,i1,i00,i01,i10,i11))
             if i00 != -1:
                 dprint(spc+'seg 0')
-                self.insert_gedge_from_stroke(stroke[:i00], only_ends, sgv0=sgv0, sgv3=gv_intersect, depth=depth+1)
+                self.insert_gedge_from_stroke(stroke[:i00], only_ends, sgv0=sgv0, sgv3=gv_intersect, depth=depth+1, crossings=crossings_in(0,i00))
             if i01 != -1 and i10 != -1:
                 dprint(spc+'seg 1')
-                self.insert_gedge_from_stroke(stroke[i01:i10], only_ends, sgv0=gv_intersect, sgv3=gv_intersect, depth=depth+1)
+                self.insert_gedge_from_stroke(stroke[i01:i10], only_ends, sgv0=gv_intersect, sgv3=gv_intersect, depth=depth+1, crossings=crossings_in(i01,i10))
             if i11 != -1:
                 dprint(spc+'seg 2')
-                self.insert_gedge_from_stroke(stroke[i11:], only_ends, sgv0=gv_intersect, sgv3=sgv3, depth=depth+1)
+                self.insert_gedge_from_stroke(stroke[i11:], only_ends, sgv0=gv_intersect, sgv3=sgv3, depth=depth+1, crossings=crossings_in(i11,len(stroke)))
             return
         
         
@@ -1197,8 +1286,13 @@ class PolyStrips(object):
                 was_close = is_close
             return (min_i0,min_i1)
         
+        # broad phase for find_stroke_crossing: line_segment_intersection only
+        # accepts stroke segments within 3x their length of the gedge segment
+        strokesegs = list(zip(stroke[:-1],stroke[1:]))
+        strokeboxes = [boxes_of_points([[pt0,pt1]], 3.0*(pt1-pt0).length)[0] for (pt0,pr0),(pt1,pr1) in strokesegs]
+        strokebox = (tuple(min(b[0][i] for b in strokeboxes) for i in range(3)), tuple(max(b[1][i] for b in strokeboxes) for i in range(3)))
+        
         def find_stroke_crossing(gedge, stroke):
-            strokesegs = list(zip(stroke[:-1],stroke[1:]))
             
             def line_segment_intersection(a0,a1, b0,b1, z):
                 '''
@@ -1240,23 +1334,36 @@ class PolyStrips(object):
                 #return (oa0+(oa1-oa0).normalized()*dist, dist, cross.x)
                 return (ob0+(ob1-ob0).normalized()*cross.x, dist, cross.x)
             
-            def find_crossing(lps):
-                tot = sum((i0[0]-i1[0]).length for i0,i1 in zip(lps[:-1],lps[1:]))
-                t = 0
+            def side_segments(lps):
+                segs = []
                 for i0,i1 in zip(lps[:-1],lps[1:]):
                     p0,r0,y0 = i0
                     p1,r1,y1 = i1
                     if r0 == 0: r0 = r1
-                    
-                    p0 = p0 + y0 * r0
-                    p1 = p1 + y1 * r1
-                    
+                    segs.append((p0 + y0 * r0, p1 + y1 * r1, y0))
+                return segs
+            
+            def find_crossing(lps, segs):
+                tot = sum((i0[0]-i1[0]).length for i0,i1 in zip(lps[:-1],lps[1:]))
+                t = 0
+                for p0,p1,y0 in segs:
                     z = (p1-p0).cross(y0).normalized()
                     
+                    box = boxes_of_points([[p0,p1]], 0)[0]
+                    if not boxes_overlap(box, strokebox):
+                        self.crossing_tests_skipped += len(strokesegs)
+                        t += (p1-p0).length
+                        continue
+                    
                     for i,strokeseg in enumerate(strokesegs):
+                        if not boxes_overlap(box, strokeboxes[i]):
+                            self.crossing_tests_skipped += 1
+                            continue
+                        
                         pt0,pr0 = strokeseg[0]
                         pt1,pr1 = strokeseg[1]
                         
+                        self.crossing_tests += 1
                         cross = line_segment_intersection(pt0,pt1, p0,p1, z)
                         if not cross: continue
                         
@@ -1270,9 +1377,20 @@ class PolyStrips(object):
                     t += (p1-p0).length
                 return None
             
-            odds = [gv for i,gv in enumerate(gedge.cache_igverts) if i%2==1]
-            cross0 = find_crossing([(gv.position,gv.radius, gv.tangent_y) for gv in odds])
-            cross1 = find_crossing([(gv.position,gv.radius,-gv.tangent_y) for gv in odds])
+            strip = gedge.cache_igverts
+            odds = range(1, len(strip), 2)
+            lps0 = [(strip.positions[i],strip.radii[i], strip.tangent_ys[i]) for i in odds]
+            lps1 = [(strip.positions[i],strip.radii[i],-strip.tangent_ys[i]) for i in odds]
+            segs0,segs1 = side_segments(lps0),side_segments(lps1)
+            
+            # skip gedges whose sides are nowhere near the stroke
+            box = boxes_of_points([[p for p0,p1,y0 in segs0+segs1 for p in (p0,p1)]], 0)[0] if segs0 else None
+            if not box or not boxes_overlap(box, strokebox):
+                self.crossing_tests_skipped += (len(segs0)+len(segs1)) * len(strokesegs)
+                return []
+            
+            cross0 = find_crossing(lps0, segs0)
+            cross1 = find_crossing(lps1, segs1)
             
             return sorted([x for x in [cross0,cross1] if x], key=lambda x: x[0])
         
@@ -1284,11 +1402,11 @@ class PolyStrips(object):
                 #dprint(spc+'%i.%i: min = %i, %i; gv.count = %i' % (i_gedge,i_gv,min_i0,min_i1,gv.count_gedges()))
                 if min_i0 != -1 and gv.count_gedges() < 4:
                     dprint(spc+'Joining gedge[%i].gvert%i; Joining stroke at 0-%i' % (i_gedge,i_gv,min_i0))
-                    self.insert_gedge_from_stroke(stroke[:min_i0], only_ends, sgv0=sgv0, sgv3=gv, depth=depth+1)
+                    self.insert_gedge_from_stroke(stroke[:min_i0], only_ends, sgv0=sgv0, sgv3=gv, depth=depth+1, crossings=[])
                     is_joined = True
                 if min_i1 != -1 and gv.count_gedges() < 4:
                     dprint(spc+'Joining gedge[%i].gvert%i; Joining stroke at %i-%i' % (i_gedge,i_gv,min_i1,len(stroke)-1))
-                    self.insert_gedge_from_stroke(stroke[min_i1:], only_ends, sgv0=gv, sgv3=sgv3, depth=depth+1)
+                    self.insert_gedge_from_stroke(stroke[min_i1:], only_ends, sgv0=gv, sgv3=sgv3, depth=depth+1, crossings=[])
                     is_joined = True
                 if is_joined: return
             
@@ -1312,14 +1430,14 @@ class PolyStrips(object):
             cb0,cb1 = cb_split
             rm = (r0+r3)/2
             
-            gv_split = self.create_gvert(cb0[3], radius=rm)
+            gv_split = self.create_gvert(cb0[3], radius=rm, snap=False)
             gv0_0    = gedge.gvert0
-            gv0_1    = self.create_gvert(cb0[1], radius=rm)
-            gv0_2    = self.create_gvert(cb0[2], radius=rm)
+            gv0_1    = self.create_gvert(cb0[1], radius=rm, snap=False)
+            gv0_2    = self.create_gvert(cb0[2], radius=rm, snap=False)
             gv0_3    = gv_split
             gv1_0    = gv_split
-            gv1_1    = self.create_gvert(cb1[1], radius=rm)
-            gv1_2    = self.create_gvert(cb1[2], radius=rm)
+            gv1_1    = self.create_gvert(cb1[1], radius=rm, snap=False)
+            gv1_2    = self.create_gvert(cb1[2], radius=rm, snap=False)
             gv1_3    = gedge.gvert3
             
             self.disconnect_gedge(gedge)
@@ -1363,18 +1481,18 @@ class PolyStrips(object):
         for i,bpts in enumerate(l_bpts):
             t0,t3,bpt0,bpt1,bpt2,bpt3 = bpts
             if i == 0:
-                gv0 = self.create_gvert(bpt0, radius=r0) if not sgv0 else sgv0
+                gv0 = self.create_gvert(bpt0, radius=r0, snap=False) if not sgv0 else sgv0
                 fgv = gv0
             else:
                 gv0 = pregv
             
-            gv1 = self.create_gvert(bpt1,radius=(r0+r3)/2)
-            gv2 = self.create_gvert(bpt2,radius=(r0+r3)/2)
+            gv1 = self.create_gvert(bpt1,radius=(r0+r3)/2, snap=False)
+            gv2 = self.create_gvert(bpt2,radius=(r0+r3)/2, snap=False)
             
             if i == len(l_bpts)-1:
-                gv3 = self.create_gvert(bpt3, radius=r3) if not sgv3 else sgv3
+                gv3 = self.create_gvert(bpt3, radius=r3, snap=False) if not sgv3 else sgv3
             else:
-                gv3 = self.create_gvert(bpt3, radius=r3)
+                gv3 = self.create_gvert(bpt3, radius=r3, snap=False)
             
             if (gv1.position-gv0.position).length == 0: dprint('gv01.der = 0')
             if (gv2.position-gv3.position).length == 0: dprint('gv32.der = 0')
@@ -1402,8 +1520,9 @@ class PolyStrips(object):
         p00,p01,p02,p03 = gedge0.get_positions()
         p10,p11,p12,p13 = gedge1.get_positions()
         
-        pts0 = [cubic_bezier_blend_t(p00,p01,p02,p03,i/tessellation) for i in range(tessellation+1)]
-        pts1 = [cubic_bezier_blend_t(p10,p11,p12,p13,i/tessellation) for i in range(tessellation+1)]
+        l_t  = [i/tessellation for i in range(tessellation+1)]
+        pts0 = cubic_bezier_blend_ts(p00,p01,p02,p03, l_t)
+        pts1 = cubic_bezier_blend_ts(p10,p11,p12,p13, l_t)
         if gedge0.gvert0 == gvert: pts0.reverse()
         if gedge1.gvert3 == gvert: pts1.reverse()
         pts = pts0 + pts1
@@ -1411,8 +1530,8 @@ class PolyStrips(object):
         t0,t3,p0,p1,p2,p3 = cubic_bezier_fit_points(pts, self.length_scale, allow_split=False)[0]
         
         gv0 = gedge0.gvert3 if gedge0.gvert0 == gvert else gedge0.gvert0
-        gv1 = self.create_gvert(p1, gvert.radius)
-        gv2 = self.create_gvert(p2, gvert.radius)
+        gv1 = self.create_gvert(p1, gvert.radius, snap=False)
+        gv2 = self.create_gvert(p2, gvert.radius, snap=False)
         gv3 = gedge1.gvert3 if gedge1.gvert0 == gvert else gedge1.gvert0
         
         self.disconnect_gedge(gedge0)
@@ -1423,31 +1542,92 @@ class PolyStrips(object):
         gv3.update()
         gv3.update_gedges()
     
-    def create_mesh(self):
-        mx = bpy.data.objects[self.o_name].matrix_world
-        imx = mx.inverted()
+    def create_mesh(self, mx=None):
+        '''
+        returns (verts, quads) of the retopo mesh
+        verts are transformed by mx (default: into object space of the source object)
+        '''
+        verts,quads = self.build_mesh()
+        if mx is None: mx = self.xform.imx
+        return ([mx*v for v in verts], [tuple(quads[i:i+4]) for i in range(0,len(quads),4)])
+    
+    def create_mesh_buffers(self, mx=None):
+        '''
+        returns create_mesh as flat buffers for bulk mesh creation:
+        (array('f') of vertex coordinates, array('i') of quad vertex indices, 4 per quad)
+        chunks are transformed as they are emitted, so world space verts of the whole mesh are never held
+        '''
+        if mx is None: mx = self.xform.imx
+        co,quads = array('f'),array('i')
+        for lv,lq in self.iter_mesh_chunks():
+            co += transform_points_flat(lv, mx)
+            quads += lq
+        return (co, quads)
+    
+    def build_mesh(self):
+        '''
+        returns (verts, quads) of the retopo mesh, verts in world space and
+        quads as flat array('i') of vert indices, 4 per quad
+        '''
+        verts,quads = [],array('i')
+        for lv,lq in self.iter_mesh_chunks():
+            verts += lv
+            quads += lq
+        
+        # remove unused verts and remap quads
+        keep,quads,n_orphans = compact_vert_indices(len(verts), quads)
+        if n_orphans:
+            verts = [verts[i] for i in keep]
+            self.mesh_orphans += n_orphans
+        if self.mesh_orphans: dprint('create mesh: %i gvert corners / verts unused' % self.mesh_orphans, l=4)
         
+        return (verts,quads)
+    
+    def iter_mesh_chunks(self):
+        '''
+        generates the retopo mesh one gedge at a time, as soon as the gedges it zips to are done
+        yields (verts, quads): the new verts in world space, numbered on from the verts of earlier
+        chunks, and flat array('i') of quad vert indices (4 per quad, may use verts of earlier chunks)
+        '''
+        self.mesh_orphans = 0
+        base  = 0                       # index of first vert of current chunk
         verts = []
-        quads = []
+        quads = array('i')
         
         igv_corner_vind = {}    # maps (igv,corner) to idx into verts
-        ige_side_lvind  = {}    # maps (ige,side) to list of vert indices
+        ige_side_lvind  = {}    # maps (ige,side) to list of vert indices, while zipped gedges still need it
         
         gv_idx = {gv:i for i,gv in enumerate(self.gverts)}
         ge_idx = {ge:i for i,ge in enumerate(self.gedges)}
         
+        # side verts of a gedge are needed only until every gedge and gvert zipped to it is created
+        zip_refs = {}                   # maps ige to number of gedges and gverts still to zip to it
+        def add_ref(ge):
+            i_ge = ge_idx[ge]
+            zip_refs[i_ge] = zip_refs.get(i_ge, 0) + 1
+        def release_ref(ge):
+            i_ge = ge_idx[ge]
+            zip_refs[i_ge] -= 1
+            if zip_refs[i_ge] == 0:
+                del ige_side_lvind[(i_ge, 1)]
+                del ige_side_lvind[(i_ge,-1)]
+        for ge in self.gedges:
+            if ge.zip_to_gedge: add_ref(ge.zip_to_gedge)
+        for gv in set(gv for ge in self.gedges for gv in (ge.gvert0,ge.gvert3)):
+            if gv.zip_over_gedge: add_ref(gv.zip_over_gedge.zip_to_gedge)
+        
         def create_quad(iv0,iv1,iv2,iv3):
-            quads.append((iv0,iv1,iv2,iv3))
+            quads.extend((iv0,iv1,iv2,iv3))
         
         def insert_vert(v):
-            verts.append(imx*v)
-            return len(verts)-1
+            verts.append(v)
+            return base+len(verts)-1
         
         def create_vert(gv):
             i_gv = gv_idx[gv]
             if (i_gv,0) in igv_corner_vind: return
             
-            liv = [insert_vert(p) for p in gv.get_corners()]
+            liv = [None,None,None,None]
             
             if gv.zip_over_gedge:
                 zip_ge   = gv.zip_over_gedge
@@ -1470,6 +1650,12 @@ class PolyStrips(object):
                 
                 liv[ci0] = side_lvind[zip_igv]
                 liv[ci1] = side_lvind[zip_igv-1]
+                
+                # corners on the zipped side are the side verts of zip_to
+                self.mesh_orphans += 2
+                release_ref(zip_to)
+            
+            liv = [insert_vert(p) if iv is None else iv for p,iv in zip(gv.get_corners(),liv)]
             
             igv_corner_vind[(i_gv,0)] = liv[0]
             igv_corner_vind[(i_gv,1)] = liv[1]
@@ -1479,138 +1665,117 @@ class PolyStrips(object):
             create_quad(liv[3],liv[2],liv[1],liv[0])
         
         
-        done = set()                    # set of gedges that have been created
-        defering = set(self.gedges)     # set of gedges that still need to be created
-        while defering:
-            working,defering = defering,set()
+        # gedges whose end gverts are zipped come after the gedges they zip to
+        for ge in zip_order(self.gedges):
+            create_vert(ge.gvert0)
+            create_vert(ge.gvert3)
             
-            for ge in working:
-                if any(gv.zip_over_gedge and gv.zip_over_gedge.zip_to_gedge not in done for gv in [ge.gvert0,ge.gvert3]):
-                    # defer gedge for now, because it is not ready to be created, yet
-                    defering |= {ge}
-                    continue
-                
-                create_vert(ge.gvert0)
-                create_vert(ge.gvert3)
-                
-                i_ge = ge_idx[ge]
-                l = len(ge.cache_igverts)
-                
-                i0 = gv_idx[ge.gvert0]
-                i3 = gv_idx[ge.gvert3]
-                i00,i01 = ge.gvert0.get_cornerinds_of(ge)           #  inside index of gvert0
-                i02,i03 = ge.gvert0.get_back_cornerinds_of(ge)      # outside index of gvert0
-                i32,i33 = ge.gvert3.get_cornerinds_of(ge)           #  inside index of gvert3
-                i30,i31 = ge.gvert3.get_back_cornerinds_of(ge)      # outside index of gvert3
-                
-                c0,c3 = igv_corner_vind[(i0,i00)], igv_corner_vind[(i3,i33)]
-                c1,c2 = igv_corner_vind[(i0,i01)], igv_corner_vind[(i3,i32)]
-                
-                ige_side_lvind[(i_ge, 1)] = [igv_corner_vind[(i0,i03)], c0]
-                ige_side_lvind[(i_ge,-1)] = [igv_corner_vind[(i0,i02)], c1]
-                
-                if not ge.zip_to_gedge:
-                    # creating non-zipped gedge
-                    if l == 0:
-                        # no segments
-                        create_quad(c0,c1,c2,c3)
-                    else:
-                        cc0,cc1 = c0,c1
-                        for i,gvert in enumerate(ge.cache_igverts):
-                            if i%2 == 0: continue                       # even == quad centers
-                            if i == 1:   continue                       # ignore first (generate quad with i-2 and i)
-                            
-                            if i == l-2:
-                                cc2 = c2
-                                cc3 = c3
-                            else:
-                                p2 = gvert.position-gvert.tangent_y*gvert.radius
-                                p3 = gvert.position+gvert.tangent_y*gvert.radius
-                                p2 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*p2)[0]
-                                p3 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*p3)[0]
-                                cc2 = insert_vert(p2)
-                                cc3 = insert_vert(p3)
-                            
-                            create_quad(cc0, cc1, cc2, cc3)
-                            if i < l-2:
-                                ige_side_lvind[(i_ge, 1)] += [cc3]
-                                ige_side_lvind[(i_ge,-1)] += [cc2]
-                            
-                            cc0,cc1 = cc3,cc2
-                    
-                
-                #elif i == len(ge.cache_igverts) - 1 and ge.force_count:
-                    #print('did the funky math')
-                    #p2, p3 = ge.gvert3.get_corners_of(ge)
-                    #cc2, cc3 = verts.index(imx * p2), verts.index(imx * p3)
+            i_ge = ge_idx[ge]
+            strip = ge.cache_igverts
+            rail_pos,rail_neg = strip.rail_pos,strip.rail_neg
+            l = len(strip)
+            
+            i0 = gv_idx[ge.gvert0]
+            i3 = gv_idx[ge.gvert3]
+            i00,i01 = ge.gvert0.get_cornerinds_of(ge)           #  inside index of gvert0
+            i02,i03 = ge.gvert0.get_back_cornerinds_of(ge)      # outside index of gvert0
+            i32,i33 = ge.gvert3.get_cornerinds_of(ge)           #  inside index of gvert3
+            i30,i31 = ge.gvert3.get_back_cornerinds_of(ge)      # outside index of gvert3
+            
+            c0,c3 = igv_corner_vind[(i0,i00)], igv_corner_vind[(i3,i33)]
+            c1,c2 = igv_corner_vind[(i0,i01)], igv_corner_vind[(i3,i32)]
+            
+            ige_side_lvind[(i_ge, 1)] = [igv_corner_vind[(i0,i03)], c0]
+            ige_side_lvind[(i_ge,-1)] = [igv_corner_vind[(i0,i02)], c1]
+            
+            if not ge.zip_to_gedge:
+                # creating non-zipped gedge
+                if l == 0:
+                    # no segments
+                    create_quad(c0,c1,c2,c3)
                 else:
-                    # creating zippered gedge
-                    i_zge  = ge_idx[ge.zip_to_gedge]
-                    lzvind = ige_side_lvind[(i_zge,ge.zip_side)]
-                    i_zgv0 = 1+int(ge.gvert0.zip_igv/2)
-                    i_zgv3 = 1+int(ge.gvert3.zip_igv/2)
-                    
-                    if i_zgv0 < i_zgv3:
-                        lzvind = lzvind[i_zgv0:i_zgv3+1]
-                    else:
-                        lzvind = lzvind[i_zgv3:i_zgv0+1]
-                        lzvind.reverse()
-                    
-                    dprint('lzvind (%i) = %s' % (len(lzvind),str(lzvind)))
-                    dprint('l = %i' % l)
-                    
-                    lzvind = lzvind[1:-1]
                     cc0,cc1 = c0,c1
-                    for i,gvert in enumerate(ge.cache_igverts):
-                        if i%2 == 0: continue
-                        if i == 1:   continue
-                        i_z = int((i-3)/2)
+                    for i in range(l):
+                        if i%2 == 0: continue                       # even == quad centers
+                        if i == 1:   continue                       # ignore first (generate quad with i-2 and i)
                         
                         if i == l-2:
-                            cc2,cc3 = c2,c3
+                            cc2 = c2
+                            cc3 = c3
                         else:
-                            if ge.zip_side*ge.zip_dir == 1:
-                                p3 = gvert.position+gvert.tangent_y*gvert.radius
-                                p3 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*p3)[0]
-                                cc3 = insert_vert(p3)
-                                cc2 = lzvind[i_z]
-                            else:
-                                p2 = gvert.position-gvert.tangent_y*gvert.radius
-                                p2 = mx * bpy.data.objects[self.o_name].closest_point_on_mesh(imx*p2)[0]
-                                cc2 = insert_vert(p2)
-                                cc3 = lzvind[i_z]
+                            cc2 = insert_vert(rail_neg[i])
+                            cc3 = insert_vert(rail_pos[i])
                         
-                        dprint('new quad: %i %i %i %i' % (cc0,cc1,cc2,cc3))
                         create_quad(cc0, cc1, cc2, cc3)
                         if i < l-2:
                             ige_side_lvind[(i_ge, 1)] += [cc3]
                             ige_side_lvind[(i_ge,-1)] += [cc2]
                         
                         cc0,cc1 = cc3,cc2
-                    
                 
+            
+            #elif i == len(ge.cache_igverts) - 1 and ge.force_count:
+                #print('did the funky math')
+                #p2, p3 = ge.gvert3.get_corners_of(ge)
+                #cc2, cc3 = verts.index(imx * p2), verts.index(imx * p3)
+            else:
+                # creating zippered gedge
+                i_zge  = ge_idx[ge.zip_to_gedge]
+                lzvind = ige_side_lvind[(i_zge,ge.zip_side)]
+                i_zgv0 = 1+int(ge.gvert0.zip_igv/2)
+                i_zgv3 = 1+int(ge.gvert3.zip_igv/2)
                 
-                ige_side_lvind[(i_ge, 1)] += [c3, igv_corner_vind[(i3,i30)]]
-                ige_side_lvind[(i_ge,-1)] += [c2, igv_corner_vind[(i3,i31)]]
+                if i_zgv0 < i_zgv3:
+                    lzvind = lzvind[i_zgv0:i_zgv3+1]
+                else:
+                    lzvind = lzvind[i_zgv3:i_zgv0+1]
+                    lzvind.reverse()
                 
-                # mark gedge as done
-                done |= {ge}
-        
-        # remove unused verts and remap quads
-        vind_used = [False for v in verts]
-        for q in quads:
-            for vind in q:
-                vind_used[vind] = True
-        i_new = 0
-        map_vinds = {}
-        for i_vind,used in enumerate(vind_used):
-            if used:
-                map_vinds[i_vind] = i_new
-                i_new += 1
-        verts = [v for u,v in zip(vind_used,verts) if u]
-        quads = [tuple(map_vinds[vind] for vind in q) for q in quads]
-        
-        return (verts,quads)
+                dprint('lzvind (%i) = %s' % (len(lzvind),str(lzvind)))
+                dprint('l = %i' % l)
+                
+                lzvind = lzvind[1:-1]
+                
+                # free side verts of gedge
+                sgn = 1 if ge.zip_side*ge.zip_dir == 1 else -1
+                
+                cc0,cc1 = c0,c1
+                for i in range(l):
+                    if i%2 == 0: continue
+                    if i == 1:   continue
+                    i_z = int((i-3)/2)
+                    
+                    if i == l-2:
+                        cc2,cc3 = c2,c3
+                    else:
+                        if sgn == 1:
+                            cc3 = insert_vert(rail_pos[i])
+                            cc2 = lzvind[i_z]
+                        else:
+                            cc2 = insert_vert(rail_neg[i])
+                            cc3 = lzvind[i_z]
+                    
+                    dprint('new quad: %i %i %i %i' % (cc0,cc1,cc2,cc3))
+                    create_quad(cc0, cc1, cc2, cc3)
+                    if i < l-2:
+                        ige_side_lvind[(i_ge, 1)] += [cc3]
+                        ige_side_lvind[(i_ge,-1)] += [cc2]
+                    
+                    cc0,cc1 = cc3,cc2
+                
+            
+            
+            ige_side_lvind[(i_ge, 1)] += [c3, igv_corner_vind[(i3,i30)]]
+            ige_side_lvind[(i_ge,-1)] += [c2, igv_corner_vind[(i3,i31)]]
+            if i_ge not in zip_refs:
+                del ige_side_lvind[(i_ge, 1)]
+                del ige_side_lvind[(i_ge,-1)]
+            if ge.zip_to_gedge: release_ref(ge.zip_to_gedge)
+            
+            yield (verts, quads)
+            base += len(verts)
+            verts = []
+            quads = array('i')
     
     def rip_gvert(self, gvert):
         '''
@@ -1659,6 +1824,7 @@ class PolyStrips(object):
             self.disconnect_gedge(ge)
             self.create_gedge(*l_gv)
         self.gverts = [gv for gv in self.gverts if gv!=gvert0]
+        self.forget_spatial(gvert0)
         gvert1.update_gedges()
         return gvert1
 
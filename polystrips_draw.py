@@ -38,6 +38,7 @@ from lib import common_drawing
 from lib.common_utilities import iter_running_sum, dprint, get_object_length_scale, profiler, AddonLocator
 
 from polystrips_utilities import *
+from polystrips_drawcache import project_points
 
 
 #Make the addon name and location accessible
@@ -47,9 +48,9 @@ def draw_gedge_text(gedge,context, text):
     l = len(gedge.cache_igverts)
     if l > 4:
         n_quads = math.floor(l/2) + 1
-        mid_vert_ind = math.floor(l/2)
-        mid_vert = gedge.cache_igverts[mid_vert_ind]
-        position_3d = mid_vert.position + 1.5 * mid_vert.tangent_y * mid_vert.radius
+        i = math.floor(l/2)
+        strip = gedge.cache_igverts
+        position_3d = strip.positions[i] + 1.5 * strip.tangent_ys[i] * strip.radii[i]
     else:
         position_3d = (gedge.gvert0.position + gedge.gvert3.position)/2
     
@@ -68,3 +69,80 @@ def draw_gedge_info(gedge,context):
     else:
         n_quads = 3
     draw_gedge_text(gedge, context, str(n_quads))
+
+
+def draw_quads_2d(xy, ok, mask, color):
+    '''
+    draws quads i where mask[i], in one glBegin/glEnd
+    xy is a flat list of 2D corners, 4 per quad; ok[j] is False for corners behind the view
+    '''
+    bgl.glEnable(bgl.GL_BLEND)
+    bgl.glColor4f(*color)
+    bgl.glBegin(bgl.GL_QUADS)
+    for i,m in enumerate(mask):
+        if not m or not all(ok[4*i:4*i+4]): continue
+        for j in range(8*i, 8*i+8, 2):
+            bgl.glVertex2f(xy[j], xy[j+1])
+    bgl.glEnd()
+
+def draw_quad_outlines_2d(xy, ok, mask, color, thickness):
+    '''
+    draws stippled outlines of quads i where mask[i], in one glBegin/glEnd
+    '''
+    bgl.glLineStipple(4, 0x5555)
+    bgl.glEnable(bgl.GL_LINE_STIPPLE)
+    bgl.glEnable(bgl.GL_BLEND)
+    bgl.glColor4f(*color)
+    bgl.glLineWidth(thickness)
+    bgl.glBegin(bgl.GL_LINES)
+    for i,m in enumerate(mask):
+        if not m or not all(ok[4*i:4*i+4]): continue
+        for k in range(4):
+            j0,j1 = 8*i + 2*k, 8*i + 2*((k+1)%4)
+            bgl.glVertex2f(xy[j0], xy[j0+1])
+            bgl.glVertex2f(xy[j1], xy[j1+1])
+    bgl.glEnd()
+    bgl.glDisable(bgl.GL_LINE_STIPPLE)
+    bgl.glLineWidth(1)
+
+def draw_points_2d(xy, ok, mask, color, size):
+    bgl.glColor4f(*color)
+    bgl.glPointSize(size)
+    bgl.glBegin(bgl.GL_POINTS)
+    for i,m in enumerate(mask):
+        if not m or not ok[i]: continue
+        bgl.glVertex2f(xy[2*i], xy[2*i+1])
+    bgl.glEnd()
+    bgl.glPointSize(1.0)
+
+def draw_drawcache(context, drawcache, color_inactive, color_selection, sel_gedges, sel_gverts):
+    '''
+    draws the gedge segments, gvert corners and gvert points in drawcache
+    (each in the inactive and the selection color) with a handful of bulk submissions
+    '''
+    drawcache.update()
+
+    region,r3d = context.region, context.space_data.region_3d
+    persp = r3d.perspective_matrix
+
+    fill_inactive   = (color_inactive[0], color_inactive[1], color_inactive[2], 0.20)
+    border_inactive = (color_inactive[0], color_inactive[1], color_inactive[2], 1.00)
+    fill_selected   = (color_selection[0], color_selection[1], color_selection[2], 0.20)
+    border_selected = (color_selection[0], color_selection[1], color_selection[2], 1.00)
+
+    xy,ok = project_points(drawcache.quads, persp, region.width, region.height)
+    unsel,sel = drawcache.quad_masks(sel_gedges)
+    draw_quads_2d(xy, ok, unsel, fill_inactive)
+    draw_quad_outlines_2d(xy, ok, unsel, border_inactive, 1)
+    draw_quads_2d(xy, ok, sel, fill_selected)
+    draw_quad_outlines_2d(xy, ok, sel, border_selected, 1)
+
+    xy,ok = project_points(drawcache.gvert_quads, persp, region.width, region.height)
+    vis,unsel,sel = drawcache.gvert_masks(sel_gverts)
+    draw_quads_2d(xy, ok, unsel, fill_inactive)
+    draw_quad_outlines_2d(xy, ok, unsel, border_inactive, 1)
+    draw_quads_2d(xy, ok, sel, fill_selected)
+    draw_quad_outlines_2d(xy, ok, sel, border_selected, 1)
+
+    xy,ok = project_points(drawcache.points, persp, region.width, region.height)
+    draw_points_2d(xy, ok, vis, border_inactive, 4)
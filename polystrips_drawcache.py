@@ -0,0 +1,198 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+# builds the flat arrays drawn by draw_callback_themed.  nothing in here
+# touches bgl, so it runs without a 3D view (see polystrips_draw for drawing)
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+class DrawCache(object):
+    '''
+    Flat float arrays of what draw_callback_themed draws:
+        quads       segments of all gedges, 4 corners (12 floats) per quad
+        gvert_quads corners of connected gverts, 12 floats per gvert
+        points      positions of connected gverts, 3 floats per gvert
+
+    The segments of each gedge are cached separately and rebuilt only when
+    the update graph reports the gedge (or one of its gverts) as changed.
+    Visibility and selection are applied as masks when drawing, so changing
+    them never rebuilds anything.
+    '''
+
+    def __init__(self, polystrips):
+        self.polystrips = polystrips
+
+        self.gedge_cache = {}       # gedge -> (quad corners, visibility gverts a, visibility gverts b)
+        self.dirty_gedges = set()
+        self.dirty_gverts = True
+
+        self.lgedges = []           # gedges in quads, in order
+        self.gedge_ranges = {}      # gedge -> (first quad, last quad + 1)
+        self.quads  = array('f')
+        self.quad_vis0 = []         # quad is visible if quad_vis0[i] and quad_vis1[i] are visible
+        self.quad_vis1 = []
+
+        self.lgverts = []           # gverts whose corners are in gvert_quads and positions in points
+        self.all_gverts = []        # self.polystrips.gverts when gvert arrays were built
+        self.gvert_index = {}       # gvert -> index into lgverts
+        self.gvert_quads = array('f')
+        self.points = array('f')
+
+        self.rebuilt_gedges = 0     # counters
+        self.rebuilt_gverts = 0
+
+        polystrips.graph.add_listener(self.invalidate)
+
+    def invalidate(self, gverts, gedges):
+        '''
+        update graph listener
+        '''
+        self.dirty_gedges.update(gedges)
+        for gv in gverts:
+            # corners of end gverts are the first and last corners of their gedges
+            self.dirty_gedges.update(gv.get_gedges_notnone())
+        self.dirty_gverts = True
+
+    def update(self):
+        '''
+        rebuilds whatever changed since the last update
+        '''
+        ps = self.polystrips
+
+        if self.dirty_gedges or ps.gedges != self.lgedges:
+            for ge in self.dirty_gedges: self.gedge_cache.pop(ge, None)
+            self.dirty_gedges = set()
+            if ps.gedges != self.lgedges:
+                keep = set(ps.gedges)
+                self.gedge_cache = {ge:v for ge,v in self.gedge_cache.items() if ge in keep}
+            self._build_quads()
+
+        if self.dirty_gverts or ps.gverts != self.all_gverts:
+            self._build_gverts()
+            self.dirty_gverts = False
+
+    def _build_gedge(self, gedge):
+        segments = list(gedge.iter_segments_gverts())
+        corners = array('f', bytes(12*4*len(segments)))
+        lvis0,lvis1 = [],[]
+        i = 0
+        for quad,lgv in segments:
+            for c in quad:
+                corners[i:i+3] = array('f', c)
+                i += 3
+            lvis0.append(lgv[0])
+            lvis1.append(lgv[-1])
+        self.rebuilt_gedges += 1
+        return (corners, lvis0, lvis1)
+
+    def _build_quads(self):
+        self.lgedges = list(self.polystrips.gedges)
+        for ge in self.lgedges:
+            if ge not in self.gedge_cache:
+                self.gedge_cache[ge] = self._build_gedge(ge)
+
+        n = sum(len(self.gedge_cache[ge][1]) for ge in self.lgedges)
+        self.quads = array('f', bytes(12*4*n))
+        self.quad_vis0,self.quad_vis1 = [],[]
+        self.gedge_ranges = {}
+        i = 0
+        for ge in self.lgedges:
+            corners,lvis0,lvis1 = self.gedge_cache[ge]
+            self.quads[12*i:12*(i+len(lvis0))] = corners
+            self.gedge_ranges[ge] = (i, i+len(lvis0))
+            self.quad_vis0 += lvis0
+            self.quad_vis1 += lvis1
+            i += len(lvis0)
+
+    def _build_gverts(self):
+        self.all_gverts = list(self.polystrips.gverts)
+        self.lgverts = [gv for gv in self.all_gverts if not gv.is_unconnected()]
+        self.gvert_index = {gv:i for i,gv in enumerate(self.lgverts)}
+        self.gvert_quads = array('f', bytes(12*4*len(self.lgverts)))
+        self.points = array('f', bytes(3*4*len(self.lgverts)))
+        for i,gv in enumerate(self.lgverts):
+            self.gvert_quads[12*i:12*i+12] = array('f', [v for c in gv.get_corners() for v in c])
+            self.points[3*i:3*i+3] = array('f', gv.position)
+        self.rebuilt_gverts += len(self.lgverts)
+
+    def quad_masks(self, sel_gedges):
+        '''
+        returns (visibility of unselected quads, visibility of quads of sel_gedges)
+        '''
+        vis = [a.visible and b.visible for a,b in zip(self.quad_vis0,self.quad_vis1)]
+        sel = [False]*len(vis)
+        for ge in sel_gedges:
+            if ge not in self.gedge_ranges: continue
+            i0,i1 = self.gedge_ranges[ge]
+            sel[i0:i1] = vis[i0:i1]
+            vis[i0:i1] = [False]*(i1-i0)
+        return (vis, sel)
+
+    def gvert_masks(self, sel_gverts):
+        '''
+        returns (visibility of all gverts, of unselected gverts, of sel_gverts), indexed as lgverts
+        '''
+        vis = [gv.visible for gv in self.lgverts]
+        unsel,sel = list(vis),[False]*len(vis)
+        for gv in sel_gverts:
+            if gv not in self.gvert_index: continue
+            i = self.gvert_index[gv]
+            sel[i],unsel[i] = vis[i],False
+        return (vis, unsel, sel)
+
+
+def project_points(co, persp, width, height):
+    '''
+    projects flat list of 3D points co into region space
+    persp is the 4x4 perspective matrix of the region, as for location_3d_to_region_2d
+    returns (flat list of 2D points, list of whether each point is in front of the view)
+    '''
+    n = len(co) // 3
+    hw,hh = width/2.0, height/2.0
+    if np:
+        p = np.frombuffer(co, dtype=np.float32).reshape((n,3)) if isinstance(co, array) else np.array(co, dtype=np.float64).reshape((n,3))
+        m = np.array([list(row) for row in persp], dtype=np.float64)
+        prj = p.dot(m[:,:3].T) + m[:,3]
+        w = prj[:,3]
+        ok = w > 0.0
+        w = np.where(ok, w, 1.0)
+        xy = np.empty((n,2))
+        xy[:,0] = hw + hw * prj[:,0] / w
+        xy[:,1] = hh + hh * prj[:,1] / w
+        return (xy.ravel().tolist(), ok.tolist())
+
+    r0,r1,r3 = [tuple(persp[i]) for i in (0,1,3)]
+    xy,ok = [0.0]*(2*n),[False]*n
+    for i in range(n):
+        x,y,z = co[3*i],co[3*i+1],co[3*i+2]
+        w = r3[0]*x + r3[1]*y + r3[2]*z + r3[3]
+        if w <= 0.0: continue
+        xy[2*i]   = hw + hw * (r0[0]*x + r0[1]*y + r0[2]*z + r0[3]) / w
+        xy[2*i+1] = hh + hh * (r1[0]*x + r1[1]*y + r1[2]*z + r1[3]) / w
+        ok[i] = True
+    return (xy, ok)
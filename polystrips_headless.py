@@ -0,0 +1,274 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# pure python stand-ins for the parts of mathutils and lib.common_utilities
+# that the polystrips core uses, so the core runs outside of Blender (scripts,
+# benchmarks, profiling).  they follow Blender 2.7x semantics: Matrix * Vector
+# transforms, Vector * Vector is the dot product.  polystrips_math picks these
+# only when mathutils cannot be imported.
+
+import math
+
+
+
+class Vector(object):
+    __slots__ = ['_v']
+
+    def __init__(self, seq=(0.0, 0.0, 0.0)):
+        self._v = [float(v) for v in seq]
+
+    def __len__(self): return len(self._v)
+    def __iter__(self): return iter(self._v)
+    def __repr__(self): return 'Vector((%s))' % ', '.join('%.4f' % v for v in self._v)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice): return tuple(self._v[i])
+        return self._v[i]
+    def __setitem__(self, i, v): self._v[i] = float(v)
+
+    def _axis(i):
+        return property(lambda self: self._v[i], lambda self,v: self._v.__setitem__(i, float(v)))
+    x,y,z,w = _axis(0),_axis(1),_axis(2),_axis(3)
+    del _axis
+
+    @property
+    def xy(self): return Vector(self._v[:2])
+    @property
+    def xyz(self): return Vector(self._v[:3])
+
+    def __eq__(self, other):
+        try:
+            return len(other) == len(self._v) and all(a == b for a,b in zip(self._v, other))
+        except TypeError:
+            return False
+    def __ne__(self, other): return not self.__eq__(other)
+    __hash__ = None
+
+    def __neg__(self): return Vector([-a for a in self._v])
+    def __add__(self, other): return Vector([a+b for a,b in zip(self._v, other)])
+    __radd__ = __add__
+    def __sub__(self, other): return Vector([a-b for a,b in zip(self._v, other)])
+    def __rsub__(self, other): return Vector([b-a for a,b in zip(self._v, other)])
+    def __iadd__(self, other):
+        for i,b in enumerate(other): self._v[i] += b
+        return self
+    def __isub__(self, other):
+        for i,b in enumerate(other): self._v[i] -= b
+        return self
+
+    def __mul__(self, other):
+        if isinstance(other, Vector): return self.dot(other)
+        if isinstance(other, Matrix):
+            m = other._m
+            return Vector([sum(self._v[r]*m[r][c] for r in range(len(self._v))) for c in range(len(m[0]))])
+        return Vector([a*other for a in self._v])
+    def __rmul__(self, other): return Vector([a*other for a in self._v])
+    def __truediv__(self, other): return Vector([a/other for a in self._v])
+    def __imul__(self, other):
+        self._v = [a*other for a in self._v]
+        return self
+    def __itruediv__(self, other):
+        self._v = [a/other for a in self._v]
+        return self
+
+    @property
+    def length(self): return math.sqrt(sum(a*a for a in self._v))
+    @property
+    def length_squared(self): return sum(a*a for a in self._v)
+
+    def dot(self, other): return sum(a*b for a,b in zip(self._v, other))
+
+    def cross(self, other):
+        a,b = self._v,other
+        if len(a) == 2: return a[0]*b[1] - a[1]*b[0]
+        return Vector((a[1]*b[2]-a[2]*b[1], a[2]*b[0]-a[0]*b[2], a[0]*b[1]-a[1]*b[0]))
+
+    def normalized(self):
+        l = self.length
+        if l == 0: return Vector(self._v)
+        return Vector([a/l for a in self._v])
+
+    def normalize(self):
+        l = self.length
+        if l: self._v = [a/l for a in self._v]
+
+    def angle(self, other, fallback=None):
+        l0,l1 = self.length,math.sqrt(sum(b*b for b in other))
+        if l0 == 0 or l1 == 0:
+            if fallback is not None: return fallback
+            raise ValueError('Vector.angle(other): zero length vectors have no valid angle')
+        return math.acos(max(-1.0, min(1.0, self.dot(other) / (l0*l1))))
+
+    def lerp(self, other, factor):
+        return Vector([a + (b-a)*factor for a,b in zip(self._v, other)])
+
+    def copy(self): return Vector(self._v)
+    def to_tuple(self, precision=None):
+        if precision is None: return tuple(self._v)
+        return tuple(round(a, precision) for a in self._v)
+    def to_2d(self): return Vector((self._v + [0.0, 0.0])[:2])
+    def to_3d(self): return Vector((self._v + [0.0, 0.0, 0.0])[:3])
+    def to_4d(self): return Vector((self._v + [0.0, 0.0, 0.0])[:3] + [1.0])
+
+
+class Matrix(object):
+    __slots__ = ['_m']
+
+    def __init__(self, rows=None):
+        if rows is None: rows = [[1.0 if r == c else 0.0 for c in range(4)] for r in range(4)]
+        self._m = [[float(v) for v in row] for row in rows]
+
+    @staticmethod
+    def Identity(size):
+        return Matrix([[1.0 if r == c else 0.0 for c in range(size)] for r in range(size)])
+
+    @staticmethod
+    def Translation(vector):
+        mx = Matrix.Identity(4)
+        for i in range(3): mx._m[i][3] = float(vector[i])
+        return mx
+
+    @staticmethod
+    def Scale(factor, size, axis=None):
+        mx = Matrix.Identity(size)
+        for i in range(min(size, 3)):
+            mx._m[i][i] = factor if axis is None else 1.0 + (factor-1.0)*axis[i]*axis[i]
+        return mx
+
+    def __len__(self): return len(self._m)
+    def __getitem__(self, i): return Vector(self._m[i])
+    def __iter__(self): return (Vector(row) for row in self._m)
+    def __repr__(self): return 'Matrix((%s))' % ', '.join(repr(tuple(row)) for row in self._m)
+
+    def __eq__(self, other): return isinstance(other, Matrix) and self._m == other._m
+    def __ne__(self, other): return not self.__eq__(other)
+    __hash__ = None
+
+    def __mul__(self, other):
+        m = self._m
+        if isinstance(other, Matrix):
+            o = other._m
+            return Matrix([[sum(m[r][i]*o[i][c] for i in range(len(o))) for c in range(len(o[0]))] for r in range(len(m))])
+        if isinstance(other, Vector):
+            v,n = list(other),len(m)
+            if len(v) == n:
+                return Vector([sum(m[r][c]*v[c] for c in range(n)) for r in range(n)])
+            if n == 4 and len(v) == 3:
+                # 3D vector transformed as a point (w=1)
+                v.append(1.0)
+                return Vector([sum(m[r][c]*v[c] for c in range(4)) for r in range(3)])
+            raise ValueError('Matrix * Vector: matrix and vector sizes do not match')
+        return Matrix([[a*other for a in row] for row in m])
+    def __rmul__(self, other): return Matrix([[a*other for a in row] for row in self._m])
+
+    def copy(self): return Matrix(self._m)
+    def transposed(self): return Matrix(list(zip(*self._m)))
+    def to_3x3(self): return Matrix([row[:3] for row in self._m[:3]])
+
+    def to_4x4(self):
+        mx = Matrix.Identity(4)
+        for r,row in enumerate(self._m[:4]):
+            for c,v in enumerate(row[:4]): mx._m[r][c] = v
+        return mx
+
+    def inverted(self):
+        '''
+        Gauss-Jordan elimination with partial pivoting
+        '''
+        n = len(self._m)
+        a = [list(row) + [1.0 if r == c else 0.0 for c in range(n)] for r,row in enumerate(self._m)]
+        for c in range(n):
+            p = max(range(c, n), key=lambda r: abs(a[r][c]))
+            if a[p][c] == 0.0: raise ValueError('Matrix.inverted(): matrix does not have an inverse')
+            a[c],a[p] = a[p],a[c]
+            pv = a[c][c]
+            a[c] = [v/pv for v in a[c]]
+            for r in range(n):
+                if r == c or a[r][c] == 0.0: continue
+                f = a[r][c]
+                a[r] = [v - f*vc for v,vc in zip(a[r], a[c])]
+        return Matrix([row[n:] for row in a])
+
+
+class Quaternion(object):
+    __slots__ = ['w', 'x', 'y', 'z']
+
+    def __init__(self, seq=(1.0, 0.0, 0.0, 0.0), angle=None):
+        if angle is None:
+            self.w,self.x,self.y,self.z = [float(v) for v in seq]
+            return
+        axis = Vector(seq).normalized()
+        s = math.sin(angle / 2.0)
+        self.w,self.x,self.y,self.z = math.cos(angle / 2.0), axis[0]*s, axis[1]*s, axis[2]*s
+
+    def __repr__(self): return 'Quaternion((%.4f, %.4f, %.4f, %.4f))' % (self.w, self.x, self.y, self.z)
+
+    def __mul__(self, other):
+        if isinstance(other, Quaternion):
+            w0,x0,y0,z0 = self.w,self.x,self.y,self.z
+            w1,x1,y1,z1 = other.w,other.x,other.y,other.z
+            return Quaternion((
+                w0*w1 - x0*x1 - y0*y1 - z0*z1,
+                w0*x1 + x0*w1 + y0*z1 - z0*y1,
+                w0*y1 - x0*z1 + y0*w1 + z0*x1,
+                w0*z1 + x0*y1 - y0*x1 + z0*w1,
+                ))
+        if isinstance(other, Vector):
+            # rotates other
+            u,s = Vector((self.x, self.y, self.z)),self.w
+            return u*(2.0*u.dot(other)) + other*(s*s - u.dot(u)) + u.cross(other)*(2.0*s)
+        raise TypeError('Quaternion * %s is not supported' % type(other).__name__)
+
+
+
+debug_level = 0
+
+def dprint(s, l=2):
+    if l <= debug_level: print(s)
+
+
+class Profiler(object):
+    '''
+    does nothing; same interface as lib.common_utilities.profiler
+    '''
+    class ProfilerHelper(object):
+        def done(self): pass
+
+    def start(self, text=None): return Profiler.ProfilerHelper()
+    def printout(self): pass
+    def reset(self): pass
+
+profiler = Profiler()
+
+
+def iter_running_sum(lw):
+    s = 0
+    for w in lw:
+        s += w
+        yield (w, s)
+
+def closest_t_and_distance_point_to_line_segment(p, p0, p1):
+    v = p1 - p0
+    l2 = v.length_squared
+    if l2 == 0: return (0.0, (p - p0).length)
+    t = max(0.0, min(1.0, (p - p0).dot(v) / l2))
+    return (t, (p - (p0 + v*t)).length)
@@ -0,0 +1,99 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+from array import array
+
+
+
+class IntervalStrip(object):
+    '''
+    Interval verts (igverts) of a GEdge, stored as parallel per-attribute
+    arrays instead of one GVert each: igverts never connect to gedges, have
+    no corners and are snapped as a batch, so all they need is
+        positions, normals, tangent_xs, tangent_ys  (lists of Vector)
+        radii                                       (array of double)
+        visible                                     (list of bool)
+    Even-indexed igverts are poly "centers", odd-indexed are poly "edges".
+    Positions are snapped to the surface (snap_pos == position).
+
+    rail_pos and rail_neg hold the snapped side points (position +/-
+    tangent_y*radius) of the odd igverts between the end gverts, None
+    elsewhere; they are filled by GEdge.snap_igverts.
+
+    A strip is replaced, not changed, when its gedge is recomputed; only
+    visible is written in place.  strip[i] returns an IntervalVert view for
+    code that wants one object per igvert.
+    '''
+    __slots__ = ['positions', 'normals', 'tangent_xs', 'tangent_ys', 'radii', 'visible', 'rail_pos', 'rail_neg']
+
+    def __init__(self, positions=(), normals=(), tangent_xs=(), tangent_ys=(), radii=()):
+        self.positions  = list(positions)
+        self.normals    = list(normals)
+        self.tangent_xs = list(tangent_xs)
+        self.tangent_ys = list(tangent_ys)
+        self.radii      = array('d', radii)
+        self.visible    = [True] * len(self.positions)
+        self.rail_pos   = [None] * len(self.positions)
+        self.rail_neg   = [None] * len(self.positions)
+        assert len(self.normals) == len(self.tangent_xs) == len(self.tangent_ys) == len(self.radii) == len(self.positions)
+
+    def __len__(self): return len(self.positions)
+
+    def __getitem__(self, i):
+        l = len(self.positions)
+        if i < 0: i += l
+        if not 0 <= i < l: raise IndexError('igvert index out of range')
+        return IntervalVert(self, i)
+
+    def __iter__(self):
+        for i in range(len(self.positions)): yield IntervalVert(self, i)
+
+
+class IntervalVert(object):
+    '''
+    view of igvert index of an IntervalStrip, with the attribute names of GVert
+    '''
+    __slots__ = ['strip', 'index']
+
+    def __init__(self, strip, index):
+        self.strip = strip
+        self.index = index
+
+    @property
+    def position(self):  return self.strip.positions[self.index]
+    @property
+    def snap_pos(self):  return self.strip.positions[self.index]
+    @property
+    def normal(self):    return self.strip.normals[self.index]
+    @property
+    def tangent_x(self): return self.strip.tangent_xs[self.index]
+    @property
+    def tangent_y(self): return self.strip.tangent_ys[self.index]
+    @property
+    def radius(self):    return self.strip.radii[self.index]
+
+    @property
+    def visible(self): return self.strip.visible[self.index]
+    @visible.setter
+    def visible(self, v): self.strip.visible[self.index] = v
+
+    def is_visible(self): return self.strip.visible[self.index]
@@ -0,0 +1,36 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# the math and utility names the polystrips core depends on.  inside Blender
+# they come from mathutils and lib.common_utilities; anywhere else (no bpy)
+# from the pure python stand-ins in polystrips_headless.  only the UI, the
+# drawing code and the Blender object surfaces import bpy and friends directly.
+
+try:
+    from mathutils import Vector, Matrix, Quaternion
+except ImportError:
+    from polystrips_headless import Vector, Matrix, Quaternion
+
+try:
+    from lib.common_utilities import dprint, profiler, iter_running_sum, closest_t_and_distance_point_to_line_segment
+except ImportError:
+    from polystrips_headless import dprint, profiler, iter_running_sum, closest_t_and_distance_point_to_line_segment
@@ -0,0 +1,120 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import copy
+import math
+import weakref
+
+
+
+class SpatialHash(object):
+    '''
+    Uniform grid over axis aligned boxes.  Each item is registered in every
+    cell its boxes overlap, so a point query only looks at the items of one
+    cell.  Query results are returned in insertion order.
+    '''
+    def __init__(self, cell_size, max_cells=4096):
+        self.cell_size   = float(cell_size)
+        self.max_cells   = max_cells        # per item; larger items go into the overflow list
+        self.cells       = {}               # (i,j,k) -> set of items
+        self.item_cells  = {}               # item -> list of cell keys
+        self.item_serial = weakref.WeakKeyDictionary()  # item -> serial of first insertion (kept across remove/insert, e.g. undo)
+        self.overflow    = set()            # items too large to grid
+        self.serial      = 0
+
+    def __deepcopy__(self, memo):
+        # WeakKeyDictionary does not deep copy its keys
+        sh = SpatialHash(self.cell_size, self.max_cells)
+        memo[id(self)] = sh
+        sh.cells      = copy.deepcopy(self.cells, memo)
+        sh.item_cells = copy.deepcopy(self.item_cells, memo)
+        sh.overflow   = copy.deepcopy(self.overflow, memo)
+        for item,serial in list(self.item_serial.items()):
+            sh.item_serial[copy.deepcopy(item, memo)] = serial
+        sh.serial = self.serial
+        return sh
+
+    def __len__(self): return len(self.item_cells)
+
+    def __contains__(self, item): return item in self.item_cells
+
+    def cell_of(self, p):
+        s = self.cell_size
+        return (int(math.floor(p[0]/s)), int(math.floor(p[1]/s)), int(math.floor(p[2]/s)))
+
+    def insert(self, item, boxes):
+        '''
+        (re)inserts item covering the given list of (bmin,bmax) boxes
+        '''
+        self.remove(item)
+        if item not in self.item_serial:
+            self.item_serial[item] = self.serial
+            self.serial += 1
+
+        keys = set()
+        for bmin,bmax in boxes:
+            i0,j0,k0 = self.cell_of(bmin)
+            i1,j1,k1 = self.cell_of(bmax)
+            if (i1-i0+1)*(j1-j0+1)*(k1-k0+1) + len(keys) > self.max_cells:
+                self.overflow.add(item)
+                self.item_cells[item] = []
+                return
+            keys.update((i,j,k) for i in range(i0,i1+1) for j in range(j0,j1+1) for k in range(k0,k1+1))
+
+        for key in keys:
+            if key not in self.cells: self.cells[key] = set()
+            self.cells[key].add(item)
+        self.item_cells[item] = list(keys)
+
+    def remove(self, item):
+        keys = self.item_cells.pop(item, None)
+        if keys is None: return
+        for key in keys:
+            cell = self.cells[key]
+            cell.discard(item)
+            if not cell: del self.cells[key]
+        self.overflow.discard(item)
+
+    def query(self, p):
+        '''
+        returns items whose boxes might contain p, in insertion order
+        '''
+        items = self.cells.get(self.cell_of(p), set()) | self.overflow
+        return sorted(items, key=lambda item: self.item_serial[item])
+
+
+def boxes_of_points(llpts, margin):
+    '''
+    returns a (bmin,bmax) box around each list of points in llpts, grown by margin
+    '''
+    boxes = []
+    for lpts in llpts:
+        bmin = tuple(min(p[i] for p in lpts)-margin for i in range(3))
+        bmax = tuple(max(p[i] for p in lpts)+margin for i in range(3))
+        boxes.append((bmin,bmax))
+    return boxes
+
+def boxes_overlap(box0, box1):
+    '''
+    returns True if (bmin,bmax) boxes box0 and box1 overlap
+    '''
+    (min0,max0),(min1,max1) = box0,box1
+    return all(min0[i] <= max1[i] and min1[i] <= max0[i] for i in range(3))
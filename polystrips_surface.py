@@ -0,0 +1,343 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from polystrips_math import Vector, Matrix, dprint
+
+try:
+    from lib import common_utilities
+except ImportError:
+    # outside of Blender; only MeshSurfaceIndex can be used
+    common_utilities = None
+
+try:
+    from mathutils.bvhtree import BVHTree
+except ImportError:
+    # mathutils.bvhtree is only available in Blender 2.76+
+    BVHTree = None
+
+
+
+class TransformContext(object):
+    '''
+    World matrix of an object together with its inverse and normal matrix.
+    One instance is shared by everything that transforms points of that
+    object, so the inverses are computed once instead of in every method.
+    set_matrix recomputes them only when the matrix actually changed.
+    '''
+    def __init__(self, mx=None):
+        self.mx = None
+        self.serial = 0             # bumped whenever the matrix changes
+        self.set_matrix(mx if mx is not None else Matrix.Identity(4))
+
+    def __deepcopy__(self, memo):
+        # changes to the object transform are not undoable
+        return self
+
+    def set_matrix(self, mx):
+        '''
+        returns True if mx differs from the current matrix
+        '''
+        if self.mx is not None and self.mx == mx: return False
+        self.mx     = Matrix(mx)
+        self.imx    = self.mx.inverted()
+        self.mxnorm = self.mx.transposed().inverted().to_3x3()
+        self.np_mxs = None
+        self.serial += 1
+        return True
+
+    def np_matrices(self):
+        '''
+        returns (mx, imx, mxnorm) as numpy arrays, built once per matrix
+        '''
+        if self.np_mxs is None:
+            self.np_mxs = (np.array(self.mx), np.array(self.imx), np.array(self.mxnorm))
+        return self.np_mxs
+
+
+class SurfaceIndex(object):
+    '''
+    Answers closest point queries against the surface of the source mesh.
+    Built once per PolystripsUI session and shared by the whole PolyStrips
+    graph.  Positions passed in and returned are in world space; subclasses
+    only implement nearest(), which works in object space.
+    '''
+    def __init__(self, mx, length_scale):
+        self.xform = TransformContext(mx)
+        self.length_scale = length_scale
+
+        # counters of closest point queries (closest_point, snap_points)
+        self.frame_calls  = 0
+        self.frame_points = 0
+        self.total_calls  = 0
+        self.total_points = 0
+        self.frames = 0
+
+    def __deepcopy__(self, memo):
+        # the surface never changes during a session, so undo snapshots share it
+        return self
+
+    def nearest(self, co):
+        '''
+        returns (location, normal, face index) closest to co (object space)
+        '''
+        raise NotImplementedError
+
+    def closest_point(self, p):
+        '''
+        returns (position, normal, face index) of surface point closest to p
+        '''
+        self.frame_calls  += 1
+        self.frame_points += 1
+        xf = self.xform
+        l,n,i = self.nearest(xf.imx * p)
+        return (xf.mx * l, (xf.mxnorm * n).normalized(), i)
+
+    def nearest_points(self, lco):
+        '''
+        returns lists (locations, normals, face indices) closest to each co (object space)
+        subclasses with a bulk query should override this
+        '''
+        ll,ln,li = [],[],[]
+        for co in lco:
+            l,n,i = self.nearest(co)
+            ll.append(l)
+            ln.append(n)
+            li.append(i)
+        return (ll,ln,li)
+
+    def snap_points(self, lp):
+        '''
+        snaps all points in lp to the surface with one query
+        returns lists (positions, normals, face indices)
+        '''
+        if not lp: return ([],[],[])
+        self.frame_calls  += 1
+        self.frame_points += len(lp)
+        xf = self.xform
+        if np is None:
+            ll,ln,li = self.nearest_points([xf.imx * p for p in lp])
+            return ([xf.mx * l for l in ll], [(xf.mxnorm * n).normalized() for n in ln], li)
+
+        # move the whole batch into object space and back with one multiply each
+        mx,imx,mxnorm = xf.np_matrices()
+        co = np.array([tuple(p) for p in lp], dtype=float)
+        co = co.dot(imx[:3,:3].T) + imx[:3,3]
+        ll,ln,li = self.nearest_points([Vector(c) for c in co.tolist()])
+        pos = np.array([tuple(l) for l in ll], dtype=float).dot(mx[:3,:3].T) + mx[:3,3]
+        nor = np.array([tuple(n) for n in ln], dtype=float).dot(mxnorm.T)
+        lnor = np.sqrt((nor*nor).sum(axis=1))
+        nor /= np.where(lnor > 0, lnor, 1.0)[:,None]
+        return ([Vector(p) for p in pos.tolist()], [Vector(n) for n in nor.tolist()], li)
+
+    def closest_points(self, lp):
+        return list(zip(*self.snap_points(lp)))
+
+    def end_frame(self):
+        '''
+        resets per frame counters
+        returns (calls, points) queried in the frame (edit) that just ended
+        '''
+        calls,points = self.frame_calls,self.frame_points
+        self.total_calls  += calls
+        self.total_points += points
+        self.frame_calls  = 0
+        self.frame_points = 0
+        self.frames += 1
+        if points:
+            dprint('surface: %i points queried in %i calls' % (points,calls), l=4)
+        return (calls, points)
+
+    def get_stats(self):
+        return {
+            'frames': self.frames,
+            'calls':  self.total_calls + self.frame_calls,
+            'points': self.total_points + self.frame_points,
+            }
+
+    def ray_cast_visible(self, lp, rv3d):
+        return [True for p in lp]
+
+
+class BVHSurfaceIndex(SurfaceIndex):
+    '''
+    cached triangle BVH of the source mesh (mathutils.bvhtree)
+    '''
+    def __init__(self, obj, bme):
+        SurfaceIndex.__init__(self, obj.matrix_world, common_utilities.get_object_length_scale(obj))
+        self.obj = obj
+        self.bvh = BVHTree.FromBMesh(bme)
+
+    def nearest(self, co):
+        l,n,i,d = self.bvh.find_nearest(co)
+        if l is None: return (Vector(co), Vector((0,0,1)), -1)
+        return (l,n,i)
+
+    def ray_cast_visible(self, lp, rv3d):
+        return common_utilities.ray_cast_visible(lp, self.obj, rv3d)
+
+
+class ObjectSurfaceIndex(SurfaceIndex):
+    '''
+    fallback for Blender builds without mathutils.bvhtree
+    '''
+    def __init__(self, obj):
+        SurfaceIndex.__init__(self, obj.matrix_world, common_utilities.get_object_length_scale(obj))
+        self.obj = obj
+
+    def nearest(self, co):
+        return self.obj.closest_point_on_mesh(co)
+
+    def ray_cast_visible(self, lp, rv3d):
+        return common_utilities.ray_cast_visible(lp, self.obj, rv3d)
+
+
+class MeshSurfaceIndex(SurfaceIndex):
+    '''
+    triangle BVH over plain vertex/face lists, so the polystrips core can run
+    outside of Blender (benchmarks, batch jobs)
+    verts: sequence of (x,y,z); faces: sequence of vertex index sequences
+    '''
+    def __init__(self, verts, faces, mx=None, length_scale=None, leaf_size=4):
+        mx = mx if mx is not None else Matrix.Identity(4)
+        self.verts = [Vector(v) for v in verts]
+        if length_scale is None:
+            wverts = [mx * v for v in self.verts]
+            bmin = Vector(tuple(min(v[i] for v in wverts) for i in range(3)))
+            bmax = Vector(tuple(max(v[i] for v in wverts) for i in range(3)))
+            length_scale = (bmax-bmin).length
+        SurfaceIndex.__init__(self, mx, length_scale)
+
+        # fan triangulate faces, remembering which face each triangle came from
+        self.tris = []
+        for i_f,f in enumerate(faces):
+            f = list(f)
+            for i in range(1,len(f)-1):
+                self.tris.append((f[0],f[i],f[i+1],i_f))
+        self.tri_norms = []
+        for i0,i1,i2,_ in self.tris:
+            v0,v1,v2 = self.verts[i0],self.verts[i1],self.verts[i2]
+            self.tri_norms.append((v1-v0).cross(v2-v0).normalized())
+
+        # nodes are [bmin, bmax, child0, child1, tri_start, tri_end]; leaves have child0 == -1
+        self.nodes = []
+        order = list(range(len(self.tris)))
+        if order: self._build(order, 0, len(order), leaf_size)
+        self.tri_order = order
+
+    def _build(self, order, i0, i1, leaf_size):
+        tris,verts = self.tris,self.verts
+        pts = [verts[tris[it][k]] for it in order[i0:i1] for k in range(3)]
+        bmin = Vector(tuple(min(p[i] for p in pts) for i in range(3)))
+        bmax = Vector(tuple(max(p[i] for p in pts) for i in range(3)))
+        i_node = len(self.nodes)
+        self.nodes.append([bmin,bmax,-1,-1,i0,i1])
+        if i1 - i0 <= leaf_size: return i_node
+
+        axis = max(range(3), key=lambda i: bmax[i]-bmin[i])
+        def centroid(it):
+            t = tris[it]
+            return verts[t[0]][axis] + verts[t[1]][axis] + verts[t[2]][axis]
+        order[i0:i1] = sorted(order[i0:i1], key=centroid)
+        im = (i0+i1) // 2
+        c0 = self._build(order, i0, im, leaf_size)
+        c1 = self._build(order, im, i1, leaf_size)
+        self.nodes[i_node][2:4] = [c0,c1]
+        return i_node
+
+    def nearest(self, co):
+        co = Vector(co)
+        min_d2,min_l,min_it = float('inf'),None,-1
+        stack = [0] if self.nodes else []
+        while stack:
+            bmin,bmax,c0,c1,i0,i1 = self.nodes[stack.pop()]
+            if box_distance_squared(co, bmin, bmax) >= min_d2: continue
+            if c0 == -1:
+                for it in self.tri_order[i0:i1]:
+                    t = self.tris[it]
+                    l = closest_point_on_triangle(co, self.verts[t[0]], self.verts[t[1]], self.verts[t[2]])
+                    d2 = (l-co).length_squared
+                    if d2 < min_d2: min_d2,min_l,min_it = d2,l,it
+                continue
+            # visit nearer child first (pushed last)
+            d0 = box_distance_squared(co, self.nodes[c0][0], self.nodes[c0][1])
+            d1 = box_distance_squared(co, self.nodes[c1][0], self.nodes[c1][1])
+            stack += [c1,c0] if d0 < d1 else [c0,c1]
+        if min_it == -1: return (co, Vector((0,0,1)), -1)
+        return (min_l, Vector(self.tri_norms[min_it]), self.tris[min_it][3])
+
+
+def box_distance_squared(p, bmin, bmax):
+    d2 = 0.0
+    for i in range(3):
+        v = p[i]
+        if v < bmin[i]: d2 += (bmin[i]-v)**2
+        elif v > bmax[i]: d2 += (v-bmax[i])**2
+    return d2
+
+def closest_point_on_triangle(p, a, b, c):
+    '''
+    Real-Time Collision Detection (Ericson), 5.1.5
+    '''
+    ab,ac,ap = b-a,c-a,p-a
+    d1,d2 = ab.dot(ap),ac.dot(ap)
+    if d1 <= 0 and d2 <= 0: return Vector(a)
+    bp = p-b
+    d3,d4 = ab.dot(bp),ac.dot(bp)
+    if d3 >= 0 and d4 <= d3: return Vector(b)
+    vc = d1*d4 - d3*d2
+    if vc <= 0 and d1 >= 0 and d3 <= 0:
+        return a + ab * (d1 / (d1-d3))
+    cp = p-c
+    d5,d6 = ab.dot(cp),ac.dot(cp)
+    if d6 >= 0 and d5 <= d6: return Vector(c)
+    vb = d5*d2 - d1*d6
+    if vb <= 0 and d2 >= 0 and d6 <= 0:
+        return a + ac * (d2 / (d2-d6))
+    va = d3*d6 - d5*d4
+    if va <= 0 and (d4-d3) >= 0 and (d5-d6) >= 0:
+        return b + (c-b) * ((d4-d3) / ((d4-d3)+(d5-d6)))
+    denom = 1.0 / (va+vb+vc)
+    return a + ab * (vb*denom) + ac * (vc*denom)
+
+
+def cross_normalized(la, lb):
+    '''
+    returns [a.cross(b).normalized() for a,b in zip(la,lb)], computed as one array op
+    '''
+    if not la: return []
+    if np is None: return [a.cross(b).normalized() for a,b in zip(la,lb)]
+    c = np.cross(np.array([tuple(a) for a in la], dtype=float), np.array([tuple(b) for b in lb], dtype=float))
+    lc = np.sqrt((c*c).sum(axis=1))
+    c /= np.where(lc > 0, lc, 1.0)[:,None]
+    return [Vector(v) for v in c.tolist()]
+
+
+def create_surface_index(obj, bme):
+    '''
+    builds the best surface index available in this Blender build
+    '''
+    if BVHTree: return BVHSurfaceIndex(obj, bme)
+    return ObjectSurfaceIndex(obj)
@@ -0,0 +1,104 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+
+class UndoTracked(object):
+    '''
+    mixin for GVert and GEdge
+    before an object is changed for the first time after a snapshot, the
+    journal of its update graph saves a shallow copy of its state
+
+    note: attributes must be replaced, not changed in place
+          (gv.position = gv.position + v, not gv.position += v)
+    '''
+    def __setattr__(self, name, value):
+        graph = self.__dict__.get('graph')
+        if graph is not None and graph.journal is not None:
+            graph.journal.touch(self)
+        object.__setattr__(self, name, value)
+
+
+class UndoSnapshot(object):
+    '''
+    state of a PolyStrips when the snapshot was taken, stored as
+    the gvert/gedge lists plus the old state of every object changed since
+    '''
+    def __init__(self, epoch, gverts, gedges):
+        self.epoch  = epoch
+        self.gverts = list(gverts)
+        self.gedges = list(gedges)
+        self.states = {}            # id(obj) -> (obj, shallow copy of obj.__dict__)
+
+    def __len__(self): return len(self.states)
+
+
+class UndoJournal(object):
+    '''
+    stack of copy-on-write snapshots; only the newest snapshot records changes
+    '''
+    def __init__(self):
+        self.snapshots = []
+        self.epoch = 0
+
+    def top(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def touch(self, obj):
+        d = obj.__dict__
+        if '_undo_birth' not in d:
+            # new objects have no state to restore
+            d['_undo_birth'] = self.epoch
+            return
+        snap = self.top()
+        if snap is None or d['_undo_birth'] >= snap.epoch: return
+        if d.get('_undo_epoch') == snap.epoch: return
+        if id(obj) not in snap.states:
+            snap.states[id(obj)] = (obj, dict(d))
+        d['_undo_epoch'] = snap.epoch
+
+    def snapshot(self, gverts, gedges):
+        self.epoch += 1
+        snap = UndoSnapshot(self.epoch, gverts, gedges)
+        self.snapshots.append(snap)
+        return snap
+
+    def drop_oldest(self):
+        if self.snapshots: self.snapshots.pop(0)
+
+    def clear(self):
+        self.snapshots = []
+
+    def restore(self, snap):
+        '''
+        puts every object changed since snap back into its old state
+        snap must be the newest snapshot; it is removed from the stack
+        returns the list of restored objects
+        '''
+        assert snap is self.top(), 'snapshots must be restored newest first'
+        self.snapshots.pop()
+        lobjs = []
+        for obj,state in snap.states.values():
+            d = obj.__dict__
+            d.clear()
+            d.update(state)
+            lobjs.append(obj)
+        return lobjs
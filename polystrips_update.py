@@ -0,0 +1,286 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import copy
+from collections import deque
+from contextlib import contextmanager
+
+from polystrips_math import dprint
+
+
+
+class ZipCycleError(Exception):
+    '''
+    raised when zipped gedges wait on each other in a cycle
+    '''
+    pass
+
+
+def topological_sort(items, succ):
+    '''
+    Kahn's algorithm in O(items + edges), ties broken by order of items
+    succ maps each item to the items that must come after it
+    returns (sorted items, items caught in cycles in order of items)
+    '''
+    indeg = {item:0 for item in items}
+    for item in items:
+        for s in succ[item]: indeg[s] += 1
+
+    ready = deque(item for item in items if indeg[item] == 0)
+    sorted_items = []
+    while ready:
+        item = ready.popleft()
+        sorted_items.append(item)
+        for s in succ[item]:
+            indeg[s] -= 1
+            if indeg[s] == 0: ready.append(s)
+
+    if len(sorted_items) == len(items): return (sorted_items, [])
+    done = set(sorted_items)
+    return (sorted_items, [item for item in items if item not in done])
+
+
+def zip_order(gedges):
+    '''
+    orders gedges so that each comes after the gedges its end gverts are zipped to
+    (gvert.zip_over_gedge.zip_to_gedge), which must be built first; ties keep order of gedges
+    raises ZipCycleError if some gedges wait on each other
+    '''
+    succ = {ge:[] for ge in gedges}
+    for ge in gedges:
+        for gv in (ge.gvert0, ge.gvert3):
+            if not gv.zip_over_gedge: continue
+            zge = gv.zip_over_gedge.zip_to_gedge
+            if zge in succ and ge not in succ[zge]: succ[zge].append(ge)
+
+    order,cycle = topological_sort(gedges, succ)
+    if cycle: raise ZipCycleError('%i zipped gedges wait on each other in a cycle' % len(cycle))
+    return order
+
+
+class UpdateGraph(object):
+    '''
+    Tracks which GVerts and GEdges are dirty and recomputes each of them
+    exactly once per flush, in dependency order.
+
+    A flush runs three kinds of tasks:
+        ('s',gv)  snap gvert to surface                     (GVert.update_snap)
+        ('e',ge)  recompute igverts of gedge                (GEdge.update_igverts)
+        ('c',gv)  recompute tangents and corners of gvert   (GVert.update_corners)
+
+    Dependencies:
+        snap of gvert         -> gedges attached to gvert
+        gedge                 -> corners of its gverts, gedges zipped to it
+        zipped gedge          -> other gedges at its end gverts (it moves them)
+        corners of end gvert  -> gedges zipped to gedges at that gvert
+
+    GVerts that are positioned by a zipped gedge (its end and inner gverts)
+    are updated by that gedge's task.
+    '''
+
+    def __init__(self):
+        self.dirty_gverts = []
+        self.dirty_gedges = []
+        self.defer    = 0
+        self.flushing = False
+        self.listeners = []
+        self.journal   = None           # UndoJournal recording changes to the gverts/gedges (set by PolyStrips)
+
+        # counters
+        self.frame_requested  = 0       # updates requested this frame (marks and cascade visits)
+        self.frame_recomputed = 0       # tasks actually run this frame
+        self.total_requested  = 0
+        self.total_recomputed = 0
+        self.frames = 0
+
+    def __deepcopy__(self, memo):
+        # undo snapshots get a graph with nothing pending; listeners that are
+        # bound methods are rebound to the copies of their owners
+        graph = UpdateGraph()
+        memo[id(self)] = graph
+        for fn in self.listeners:
+            if hasattr(fn, '__self__'):
+                fn = type(fn)(fn.__func__, copy.deepcopy(fn.__self__, memo))
+            graph.listeners.append(fn)
+        return graph
+
+    def add_listener(self, fn):
+        '''
+        fn(gverts, gedges) is called after each flush with the items that were recomputed
+        '''
+        self.listeners.append(fn)
+
+    def remove_listener(self, fn):
+        self.listeners = [l for l in self.listeners if l != fn]
+
+    def mark_gvert(self, gvert):
+        self.frame_requested += 1
+        if gvert not in self.dirty_gverts: self.dirty_gverts.append(gvert)
+
+    def mark_gedge(self, gedge):
+        self.frame_requested += 1
+        if gedge not in self.dirty_gedges: self.dirty_gedges.append(gedge)
+
+    def discard(self, item):
+        '''
+        forget a gvert or gedge that was removed from the graph
+        '''
+        self.dirty_gverts = [gv for gv in self.dirty_gverts if gv != item]
+        self.dirty_gedges = [ge for ge in self.dirty_gedges if ge != item]
+
+    def is_dirty(self):
+        return bool(self.dirty_gverts or self.dirty_gedges)
+
+    @contextmanager
+    def batch(self):
+        '''
+        defers flushing until the outermost batch is done
+        '''
+        self.defer += 1
+        try:
+            yield self
+        finally:
+            self.defer -= 1
+            if not self.defer: self.flush()
+
+    def flush(self):
+        if self.defer or self.flushing or not self.is_dirty(): return
+
+        self.flushing = True
+        try:
+            order,succ = self._collect()
+            order = self._sort(order, succ)
+
+            gverts,gedges = [],[]
+            for kind,item in order:
+                if kind == 's':
+                    item.update_snap()
+                elif kind == 'e':
+                    item.update_igverts()
+                    gedges.append(item)
+                else:
+                    item.update_corners()
+                    gverts.append(item)
+            self.frame_recomputed += len(order)
+        finally:
+            self.flushing = False
+
+        self.notify(gverts, gedges)
+
+    def notify(self, gverts, gedges):
+        '''
+        tells the listeners that gverts and gedges changed (by a flush or an undo)
+        '''
+        for fn in self.listeners: fn(gverts, gedges)
+
+    def end_frame(self):
+        '''
+        resets per frame counters
+        returns (requested, recomputed, avoided) for the frame that just ended
+        '''
+        requested,recomputed = self.frame_requested,self.frame_recomputed
+        avoided = max(0, requested-recomputed)
+        self.total_requested  += requested
+        self.total_recomputed += recomputed
+        self.frame_requested  = 0
+        self.frame_recomputed = 0
+        self.frames += 1
+        if recomputed:
+            dprint('update graph: %i requested, %i recomputed, %i avoided' % (requested,recomputed,avoided), l=4)
+        return (requested, recomputed, avoided)
+
+    def get_stats(self):
+        requested  = self.total_requested + self.frame_requested
+        recomputed = self.total_recomputed + self.frame_recomputed
+        return {
+            'frames':     self.frames,
+            'requested':  requested,
+            'recomputed': recomputed,
+            'avoided':    max(0, requested-recomputed),
+            }
+
+    def _collect(self):
+        '''
+        expands the dirty items into the set of tasks that must run
+        returns (tasks in discovery order, successors of each task)
+        '''
+        order = []
+        succ  = {}
+        queue = []
+
+        def add(task, pred=None):
+            if pred is not None:
+                # each cascade visit is an update the eager scheme would have run
+                self.frame_requested += 1
+                if task not in succ[pred]: succ[pred].append(task)
+            if task in succ: return
+            succ[task] = []
+            order.append(task)
+            queue.append(task)
+
+        def owner(gv):
+            # zipped gedge that positions gv, if any
+            if gv.zip_over_gedge: return gv.zip_over_gedge
+            if gv.gedge_inner and gv.gedge_inner.zip_to_gedge: return gv.gedge_inner
+            return None
+
+        def add_gvert(gv, pred=None):
+            ge = owner(gv)
+            if ge: add(('e',ge), pred)
+            else:  add(('s',gv), pred)
+
+        for gv in self.dirty_gverts: add_gvert(gv)
+        for ge in self.dirty_gedges: add(('e',ge))
+        self.dirty_gverts,self.dirty_gedges = [],[]
+
+        while queue:
+            task = queue.pop(0)
+            kind,item = task
+            if kind == 's':
+                add(('c',item), task)
+                for ge in item.get_gedges_notnone() + ([item.gedge_inner] if item.gedge_inner else []):
+                    add(('e',ge), task)
+            elif kind == 'e':
+                if item.zip_to_gedge:
+                    for gv in [item.gvert0,item.gvert3]:
+                        for ge in gv.get_gedges_notnone():
+                            if ge != item: add(('e',ge), task)
+                else:
+                    for gv in item.gverts():
+                        if owner(gv) is None: add(('c',gv), task)
+                for ge in item.zip_attached:
+                    add(('e',ge), task)
+            else:
+                for ge in item.get_gedges_notnone():
+                    for zge in ge.zip_attached:
+                        add(('e',zge), task)
+
+        return (order, succ)
+
+    def _sort(self, order, succ):
+        '''
+        topological sort (Kahn), ties broken by discovery order
+        '''
+        sorted_tasks,cycle = topological_sort(order, succ)
+        if cycle:
+            dprint('update graph: cycle among %i tasks, running them in discovery order' % len(cycle))
+            sorted_tasks += cycle
+        return sorted_tasks
@@ -21,43 +21,56 @@ Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
 
 ####class definitions####
 
-import bpy
 import math
 import time
 import copy
-import os
-import sys
-from mathutils import Vector, Quaternion, Matrix
-from mathutils.geometry import intersect_point_line, intersect_line_plane
-from bpy_extras.view3d_utils import location_3d_to_region_2d, region_2d_to_vector_3d, region_2d_to_location_3d, region_2d_to_origin_3d
-import bmesh
-import blf
 import itertools
+from array import array
+from bisect import bisect_left
 
-from lib import common_utilities
-from lib.common_utilities import dprint
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from polystrips_math import Vector, Quaternion, Matrix, dprint, iter_running_sum
 
 
 
 def blender_bezier_to_even_points(b_ob, dist):
-    
+    '''
+    returns list of paths (one per spline), each with points evenly spaced
+    by approx dist along the arc length of the spline
+    '''
     mx = b_ob.matrix_world
     paths = []
     for spline in b_ob.data.splines:
-        total_verts = []
-        pregv = None
+        segs = []               # (p0,p1,p2,p3, s_t_map) for each bezier segment
+        l_start = []            # arc length at start of each segment
+        L = 0
         for bp0,bp1 in zip(spline.bezier_points[:-1],spline.bezier_points[1:]):
-            p0 = pregv if pregv else mx * bp0.co
+            p0 = mx * bp0.co
             p1 = mx * bp0.handle_right
             p2 = mx * bp1.handle_left
             p3 = mx * bp1.co
-            
-            points = cubic_bezier_points_dist(p0, p1, p2, p3, dist, first=True)
-            total_verts.extend(points)
-            
-            L = common_utilities.get_path_length(total_verts)
-            n = round(L/dist)
-            new_verts = common_utilities.space_evenly_on_path(total_verts, [(0,1),(1,2)], n, 0)
+            s_t_map = cubic_bezier_t_of_s_dynamic(p0, p1, p2, p3)
+            segs.append((p0,p1,p2,p3,s_t_map))
+            l_start.append(L)
+            L += s_t_map.length
+        if not segs: continue
+        
+        n = max(1, int(round(L/dist)))
+        
+        # bucket target arc lengths by segment, then look up all ts of a segment at once
+        l_seg_s = [[] for seg in segs]
+        for i in range(n+1):
+            s = L*i/n
+            i_seg = min(max(bisect_left(l_start, s)-1, 0), len(segs)-1)
+            l_seg_s[i_seg].append(s - l_start[i_seg])
+        
+        new_verts = []
+        for (p0,p1,p2,p3,s_t_map),l_s in zip(segs, l_seg_s):
+            new_verts += cubic_bezier_blend_ts(p0,p1,p2,p3, s_t_map.t_of_s(l_s))
         paths.append(new_verts)
         
     return(paths)
@@ -115,6 +128,84 @@ def cubic_bezier_derivative(p0, p1, p2, p3, t):
     q0,q1,q2 = 3*(p1-p0),3*(p2-p1),3*(p3-p2)
     return quadratic_bezier_blend_t(q0, q1, q2, t)
 
+def cubic_bezier_eval(p0, p1, p2, p3, l_t, normals=None):
+    '''
+    evaluates cubic bezier at every t in l_t in one call
+    normals: optional (n0,n1,n2,n3) to blend (and normalize) along with positions
+    returns (positions, derivatives, normals or None) as lists of Vectors
+    '''
+    l_t = list(l_t)
+    if not l_t: return ([], [], [] if normals else None)
+    
+    if np is None:
+        l_w = [cubic_bezier_weights(t) for t in l_t]
+        q0,q1,q2 = 3*(p1-p0),3*(p2-p1),3*(p3-p2)
+        l_pos = [cubic_bezier_blend_weights(p0,p1,p2,p3,w) for w in l_w]
+        l_der = [quadratic_bezier_blend_t(q0,q1,q2,t) for t in l_t]
+        l_nor = None
+        if normals:
+            n0,n1,n2,n3 = normals
+            l_nor = [cubic_bezier_blend_weights(n0,n1,n2,n3,w).normalized() for w in l_w]
+        return (l_pos, l_der, l_nor)
+    
+    t0 = np.array(l_t, dtype=float)
+    t1 = 1.0 - t0
+    W = np.column_stack((t1*t1*t1, 3*t0*t1*t1, 3*t0*t0*t1, t0*t0*t0))
+    D = 3 * np.column_stack((-t1*t1, t1*t1-2*t0*t1, 2*t0*t1-t0*t0, t0*t0))
+    P = np.array([tuple(p0),tuple(p1),tuple(p2),tuple(p3)], dtype=float)
+    l_pos = [Vector(v) for v in W.dot(P).tolist()]
+    l_der = [Vector(v) for v in D.dot(P).tolist()]
+    l_nor = None
+    if normals:
+        N = W.dot(np.array([tuple(n) for n in normals], dtype=float))
+        ln = np.sqrt((N*N).sum(axis=1))
+        N /= np.where(ln > 0, ln, 1.0)[:,None]
+        l_nor = [Vector(v) for v in N.tolist()]
+    return (l_pos, l_der, l_nor)
+
+def cubic_bezier_blend_ts(v0, v1, v2, v3, l_t):
+    '''
+    returns [cubic_bezier_blend_t(v0,v1,v2,v3,t) for t in l_t]
+    '''
+    return cubic_bezier_eval(v0, v1, v2, v3, l_t)[0]
+
+def compact_vert_indices(n_verts, quads):
+    '''
+    finds which of n_verts verts are used by flat array('i') of quad vert indices
+    returns (indices of used verts in order, quads remapped to them, number of unused verts)
+    '''
+    if np is not None:
+        q = np.asarray(quads, dtype=np.int32)
+        used = np.bincount(q, minlength=n_verts) > 0
+        remap = (np.cumsum(used) - 1).astype(np.int32)
+        keep = np.flatnonzero(used)
+        return (keep.tolist(), array('i', remap[q].tobytes()), n_verts - len(keep))
+
+    used = array('b', bytes(n_verts))
+    for i in quads: used[i] = 1
+    remap = array('i', [0]) * n_verts
+    keep = []
+    for i in range(n_verts):
+        if used[i]:
+            remap[i] = len(keep)
+            keep.append(i)
+    return (keep, array('i', [remap[i] for i in quads]), n_verts - len(keep))
+
+def transform_points_flat(lp, mx):
+    '''
+    applies 4x4 matrix mx to every point in lp in one call
+    returns flat array('f') of transformed coordinates, 3 floats per point
+    '''
+    if not lp: return array('f')
+
+    if np is None:
+        return array('f', [c for p in lp for c in (mx * p)])
+
+    m = np.array([list(row) for row in mx], dtype=float)
+    co = np.array([tuple(p) for p in lp], dtype=float)
+    co = co.dot(m[:3,:3].T) + m[:3,3]
+    return array('f', co.astype(np.float32).tobytes())
+
 def cubic_bezier_points_dist(p0, p1, p2, p3, dist, first=True):
     '''
     tessellates bezier into pts that are approx dist apart
@@ -165,14 +256,50 @@ def cubic_bezier_find_closest_t_approx_distance(p0,p1,p2,p3, dist, threshold=0.1
     dret,tret = find_t(p0,p1,p2,p3,dist,0,1,threshold)
     return tret
     
+class ArcLengthTable(object):
+    '''
+    maps arc length (s) to curve parameter (t)
+    samples are stored in contiguous arrays, sorted by s
+    '''
+    def __init__(self, l_s=(0,), l_t=(0,)):
+        self.s = array('d', l_s)
+        self.t = array('d', l_t)
+    
+    def __len__(self): return len(self.s)
+    
+    def append(self, s, t):
+        self.s.append(s)
+        self.t.append(t)
+    
+    @property
+    def length(self): return self.s[-1]
+    
+    def t_at(self, s):
+        '''
+        returns t at arc length s, interpolating linearly between samples
+        '''
+        i = bisect_left(self.s, s)
+        if i == 0: return self.t[0]
+        if i == len(self.s): return self.t[-1]
+        s0,s1 = self.s[i-1],self.s[i]
+        t0,t1 = self.t[i-1],self.t[i]
+        return t0 + (t1-t0) * (s - s0)/(s1-s0)
+    
+    def t_of_s(self, l_s):
+        '''
+        returns list of t for each arc length in l_s
+        '''
+        if np is None: return [self.t_at(s) for s in l_s]
+        return np.interp(l_s, np.frombuffer(self.s), np.frombuffer(self.t)).tolist()
+
+
 def cubic_bezier_t_of_s(p0,p1,p2,p3, steps = 100):
     '''
-    returns a dictionary mapping of arclen values ot t values
+    returns an ArcLengthTable mapping of arclen values ot t values
     approximated at steps along the curve.  Dumber method than
     the decastelejue subdivision.
     '''
-    s_t_map = {}
-    s_t_map[0] = 0
+    s_t_map = ArcLengthTable()
     vi0 = p0
     cumul_length = 0      
     for i in range(1,steps+1):
@@ -180,19 +307,18 @@ def cubic_bezier_t_of_s(p0,p1,p2,p3, steps = 100):
         weights = cubic_bezier_weights(i/steps)
         vi1 = cubic_bezier_blend_weights(p0, p1, p2, p3, weights)    
         cumul_length += (vi1 - vi0).length
-        s_t_map[cumul_length] = t
+        s_t_map.append(cumul_length, t)
         vi0 = vi1
         
     return s_t_map
 
 def cubic_bezier_t_of_s_dynamic(p0,p1,p2,p3, initial_step = 50):
     '''
-    returns a dictionary mapping of arclen values ot t values
+    returns an ArcLengthTable mapping of arclen values ot t values
     approximated at steps along the curve.  Dumber method than
     the decastelejue subdivision.
     '''
-    s_t_map = {}
-    s_t_map[0] = 0
+    s_t_map = ArcLengthTable()
     
     pi0 = p0
     cumul_length = 0
@@ -210,7 +336,7 @@ def cubic_bezier_t_of_s_dynamic(p0,p1,p2,p3, initial_step = 50):
         
         v_num = (pi1 - pi0).length/dt
         v_cls = cubic_bezier_derivative(p0, p1, p2, p3, t).length
-        s_t_map[cumul_length] = t
+        s_t_map.append(cumul_length, t)
              
         pi0 = pi1
         dt *= v_cls/v_num
@@ -223,7 +349,7 @@ def cubic_bezier_t_of_s_dynamic(p0,p1,p2,p3, initial_step = 50):
     weights = cubic_bezier_weights(1)
     pi1 = cubic_bezier_blend_weights(p0, p1, p2, p3, weights)    
     cumul_length += (pi1 - pi0).length
-    s_t_map[cumul_length] = 1 
+    s_t_map.append(cumul_length, 1)
             
     dprint('initial dt %f, final dt %f' % (1/initial_step, dt), l=4)
     return s_t_map
@@ -231,81 +357,170 @@ def cubic_bezier_t_of_s_dynamic(p0,p1,p2,p3, initial_step = 50):
 
 def closest_t_of_s(s_t_map, s):
     '''
+    s_t_map: ArcLengthTable
     '''
-    d0 = 0
-    t = 1  #in case we don't find a d > s
-    for i,d in enumerate(s_t_map):
-        if d >= s:
-            if i == 0:
-                return 0
-            t1 = s_t_map[d]
-            t0 = s_t_map[d0]
-            t = t0 + (t1-t0) * (s - d0)/(d-d0)
-            return t
-        else:
-            d0 = d
-        
-    return t
+    return s_t_map.t_at(s)
+
+
+def interval_widths_total(c, r0, r3):
+    '''
+    total length of c+1 intervals whose widths go linearly from r0 to r3
+    '''
+    s = (r3-r0) / (c-1)
+    return r0*(c+1) + s*(c+1)*c/2
+
+def interval_count_for_length(l, r0, r3):
+    '''
+    returns the largest odd count c (0 if none) such that the c+1 intervals
+    of interval_widths_total fit in length l, searching counts from
+    max(4,floor(l/max(r0,r3))-2) up to the first count that does not fit
+    (at most floor(l/min(r0,r3))+1), as GEdge.update_nozip always has
+
+    for c > 1, total(c) > l exactly when (r0+r3)c^2 + (r3-r0-2l)c + (2l-2r0) > 0,
+    and total(c) grows with c for c >= 4, so the first count that does not fit
+    is right after the larger root.  the root is then checked against the same
+    float expression the linear search used, so both give identical counts.
+    '''
+    c0 = max(4, int(math.floor(l/max(r0,r3)))-2)
+    c1 = int(math.floor(l/min(r0,r3)))+2            # end of search (exclusive)
+    if c0 >= c1: return 0
+    
+    a,b,k = r0+r3, r3-r0-2*l, 2*l-2*r0
+    d = b*b - 4*a*k
+    if d < 0:
+        e = c0                                      # nothing fits
+    else:
+        e = min(max(c0, int(math.ceil((-b + math.sqrt(d)) / (2*a)))), c1)
+    
+    # e: first count in [c0,c1) that does not fit (c1 if all fit)
+    while e > c0 and interval_widths_total(e-1, r0, r3) > l: e -= 1
+    while e < c1 and not interval_widths_total(e, r0, r3) > l: e += 1
+    
+    c = e-1 if (e-1) % 2 == 1 else e-2
+    return c if c >= c0 else 0
          
         
     
 
 
-def cubic_bezier_fit_value(l_v, l_t):
-    def compute_error(v0,v1,v2,v3,l_v,l_t):
-        return math.sqrt(sum((cubic_bezier_blend_t(v0,v1,v2,v3,t)-v)**2 for v,t in zip(l_v,l_t)))
+def cubic_bezier_fit_values(l_t, l_vs):
+    '''
+    least squares fit of cubic bezier to the rows of l_vs at parameters l_t
+    all channels (columns of l_vs) share one Bernstein design matrix and one
+    4x4 normal equation solve
+    returns (list of errors per channel, (v0,v1,v2,v3) as tuples of channels)
+    '''
+    n = len(l_t)
     
     #########################################################
     # http://nbviewer.ipython.org/gist/anonymous/5688579
+    # A = B^T B, b = B^T v, where B[i] are the Bernstein weights of l_t[i]
     
-    # make the summation functions for A (16 of them)
-    A_fns = [
-        lambda l_t: sum([  2*t**0*(t-1)**6 for t in l_t]),
-        lambda l_t: sum([ -6*t**1*(t-1)**5 for t in l_t]),
-        lambda l_t: sum([  6*t**2*(t-1)**4 for t in l_t]),
-        lambda l_t: sum([ -2*t**3*(t-1)**3 for t in l_t]),
-        
-        lambda l_t: sum([ -6*t**1*(t-1)**5 for t in l_t]),
-        lambda l_t: sum([ 18*t**2*(t-1)**4 for t in l_t]),
-        lambda l_t: sum([-18*t**3*(t-1)**3 for t in l_t]),
-        lambda l_t: sum([  6*t**4*(t-1)**2 for t in l_t]),
-        
-        lambda l_t: sum([  6*t**2*(t-1)**4 for t in l_t]),
-        lambda l_t: sum([-18*t**3*(t-1)**3 for t in l_t]),
-        lambda l_t: sum([ 18*t**4*(t-1)**2 for t in l_t]),
-        lambda l_t: sum([ -6*t**5*(t-1)**1 for t in l_t]),
-        
-        lambda l_t: sum([ -2*t**3*(t-1)**3 for t in l_t]),
-        lambda l_t: sum([  6*t**4*(t-1)**2 for t in l_t]),
-        lambda l_t: sum([ -6*t**5*(t-1)**1 for t in l_t]),
-        lambda l_t: sum([  2*t**6*(t-1)**0 for t in l_t])
-        ]
-    
-    # make the summation functions for b (4 of them)
-    b_fns = [
-        lambda l_t,l_v: sum([-2*v*t**0*(t-1)**3 for t,v in zip(l_t,l_v)]),
-        lambda l_t,l_v: sum([ 6*v*t**1*(t-1)**2 for t,v in zip(l_t,l_v)]),
-        lambda l_t,l_v: sum([-6*v*t**2*(t-1)**1 for t,v in zip(l_t,l_v)]),
-        lambda l_t,l_v: sum([ 2*v*t**3*(t-1)**0 for t,v in zip(l_t,l_v)])
-        ]
-    
-    # compute the data we will put into matrix A
-    A_values = [fn(l_t) for fn in A_fns]
-    # fill the A matrix with data
-    A_matrix = Matrix(tuple(zip(*[iter(A_values)]*4)))
-    A_inv    = A_matrix.inverted()
+    if np is None:
+        l_w = [cubic_bezier_weights(t) for t in l_t]
+        k = len(l_vs[0])
+        A_matrix = Matrix([[sum(w[r]*w[c] for w in l_w) for c in range(4)] for r in range(4)])
+        A_inv    = A_matrix.inverted()
+        l_ctrl = []
+        for i in range(k):
+            b_vector = Vector([sum(w[r]*v[i] for w,v in zip(l_w,l_vs)) for r in range(4)])
+            l_ctrl.append(tuple(A_inv * b_vector))
+        l_err = [
+            math.sqrt(sum((sum(wr*cr for wr,cr in zip(w,ctrl))-v[i])**2 for w,v in zip(l_w,l_vs))) / n
+            for i,ctrl in enumerate(l_ctrl)
+            ]
+        return (l_err, tuple(zip(*l_ctrl)))
     
-    # compute the data we will put into the b vector
-    b_values = [fn(l_t, l_v) for fn in b_fns]
-    # fill the b vector with data
-    b_vector = Vector(b_values)
+    t0 = np.array(l_t, dtype=float)
+    t1 = 1.0 - t0
+    B  = np.column_stack((t1*t1*t1, 3*t0*t1*t1, 3*t0*t0*t1, t0*t0*t0))
+    V  = np.array(l_vs, dtype=float)
+    try:
+        X = np.linalg.solve(B.T.dot(B), B.T.dot(V))
+    except np.linalg.LinAlgError:
+        # too few distinct parameters to pin down all four control values
+        X = np.linalg.lstsq(B, V, rcond=None)[0]
+    R = B.dot(X) - V
+    l_err = (np.sqrt((R*R).sum(axis=0)) / n).tolist()
+    return (l_err, tuple(tuple(row) for row in X.tolist()))
+
+def cubic_bezier_fit_value(l_v, l_t):
+    l_err,(v0,v1,v2,v3) = cubic_bezier_fit_values(l_t, [(v,) for v in l_v])
+    return (l_err[0],v0[0],v1[0],v2[0],v3[0])
+
+
+class CubicBezierFitter(object):
+    '''
+    fits cubic beziers to (sub-ranges of) a sequence of points
+    cumulative arc length is computed once and shared by all sub-ranges
+    visited while splitting; each sub-range solves x,y,z together
+    '''
+    def __init__(self, l_co):
+        self.l_co = l_co
+        l_d = [0] + [(v0-v1).length for v0,v1 in zip(l_co[:-1],l_co[1:])]
+        self.l_ad = [s for d,s in iter_running_sum(l_d)]
+        self.l_xyz = [tuple(co[:3]) for co in l_co]
     
-    # solve for the unknowns in vector x
-    v0,v1,v2,v3 = A_inv * b_vector
+    def get_ts(self, i0, i1):
+        '''
+        returns arc length parameterization of points i0..i1-1, or None if degenerate
+        '''
+        ad0  = self.l_ad[i0]
+        dist = self.l_ad[i1-1] - ad0
+        if dist <= 0: return None
+        return [(ad-ad0)/dist for ad in self.l_ad[i0:i1]]
     
-    err = compute_error(v0,v1,v2,v3,l_v,l_t) / len(l_v)
+    def fit(self, i0, i1, l_t):
+        '''
+        returns (total error, p0,p1,p2,p3) of fit to points i0..i1-1
+        '''
+        l_err,ctrl = cubic_bezier_fit_values(l_t, self.l_xyz[i0:i1])
+        p0,p1,p2,p3 = [Vector(c) for c in ctrl]
+        return (sum(l_err),p0,p1,p2,p3)
     
-    return (err,v0,v1,v2,v3)
+    def fit_range(self, i0, i1, error_scale, depth=0, t0=0, t3=1, allow_split=True, force_split=False):
+        l_co = self.l_co
+        if i1-i0 < 3:
+            p0,p3 = l_co[i0],l_co[i1-1]
+            p12 = (p0+p3)/2
+            return [(t0,t3,p0,p12,p12,p3)]
+        l_t = self.get_ts(i0, i1)
+        if not l_t:
+            print('cubic_bezier_fit_points: returning []')
+            return [] #[(t0,t3,l_co[0],l_co[0],l_co[0],l_co[0])]
+        
+        tot_error,p0,p1,p2,p3 = self.fit(i0, i1, l_t)
+        dprint('total error = %f (%f)' % (tot_error,error_scale), l=4)
+        
+        if not force_split:
+            if tot_error < error_scale or depth == 4 or i1-i0<=15 or not allow_split:
+                return [(t0,t3,p0,p1,p2,p3)]
+        
+        # too much error in fit.  split sequence in two, and fit each sub-sequence
+        
+        # find a good split point
+        ind_split = -1
+        mindot = 1.0
+        for ind in range(5,i1-i0-5):
+            if l_t[ind] < 0.4: continue
+            if l_t[ind] > 0.6: break
+            
+            v0 = l_co[i0+ind-4]
+            v1 = l_co[i0+ind+0]
+            v2 = l_co[i0+ind+4]
+            d0 = (v1-v0).normalized()
+            d1 = (v2-v1).normalized()
+            dot01 = d0.dot(d1)
+            if ind_split==-1 or dot01 < mindot:
+                ind_split = ind
+                mindot = dot01
+        
+        if ind_split == -1:
+            # did not find a good splitting point!
+            return [(t0,t3,p0,p1,p2,p3)]
+        
+        tsplit = ind_split / (i1-i0-1)
+        return self.fit_range(i0, i0+ind_split, error_scale, depth=depth+1, t0=t0, t3=tsplit) + self.fit_range(i0+ind_split, i1, error_scale, depth=depth+1, t0=tsplit, t3=t3)
 
 def cubic_bezier_fit_points(l_co, error_scale, depth=0, t0=0, t3=1, allow_split=True, force_split=False):
     '''
@@ -316,65 +531,14 @@ def cubic_bezier_fit_points(l_co, error_scale, depth=0, t0=0, t3=1, allow_split=
     and p0,p1,p2,p3 are the control points of bezier
     '''
     assert l_co
-    if len(l_co)<3:
-        p0,p3 = l_co[0],l_co[-1]
-        p12 = (p0+p3)/2
-        return [(t0,t3,p0,p12,p12,p3)]
-    l_d  = [0] + [(v0-v1).length for v0,v1 in zip(l_co[:-1],l_co[1:])]
-    l_ad = [s for d,s in common_utilities.iter_running_sum(l_d)]
-    dist = sum(l_d)
-    if dist <= 0:
-        print('cubic_bezier_fit_points: returning []')
-        return [] #[(t0,t3,l_co[0],l_co[0],l_co[0],l_co[0])]
-    l_t  = [ad/dist for ad in l_ad]
-    
-    ex,x0,x1,x2,x3 = cubic_bezier_fit_value([co[0] for co in l_co], l_t)
-    ey,y0,y1,y2,y3 = cubic_bezier_fit_value([co[1] for co in l_co], l_t)
-    ez,z0,z1,z2,z3 = cubic_bezier_fit_value([co[2] for co in l_co], l_t)
-    tot_error = ex+ey+ez
-    dprint('total error = %f (%f)' % (tot_error,error_scale), l=4)
-    
-    if not force_split:
-        if tot_error < error_scale or depth == 4 or len(l_co)<=15 or not allow_split:
-            p0,p1,p2,p3 = Vector((x0,y0,z0)),Vector((x1,y1,z1)),Vector((x2,y2,z2)),Vector((x3,y3,z3))
-            return [(t0,t3,p0,p1,p2,p3)]
-    
-    # too much error in fit.  split sequence in two, and fit each sub-sequence
-    
-    # find a good split point
-    ind_split = -1
-    mindot = 1.0
-    for ind in range(5,len(l_co)-5):
-        if l_t[ind] < 0.4: continue
-        if l_t[ind] > 0.6: break
-        #if l_ad[ind] < 0.1: continue
-        #if l_ad[ind] > dist-0.1: break
-        
-        v0 = l_co[ind-4]
-        v1 = l_co[ind+0]
-        v2 = l_co[ind+4]
-        d0 = (v1-v0).normalized()
-        d1 = (v2-v1).normalized()
-        dot01 = d0.dot(d1)
-        if ind_split==-1 or dot01 < mindot:
-            ind_split = ind
-            mindot = dot01
-    
-    if ind_split == -1:
-        # did not find a good splitting point!
-        p0,p1,p2,p3 = Vector((x0,y0,z0)),Vector((x1,y1,z1)),Vector((x2,y2,z2)),Vector((x3,y3,z3))
-        return [(t0,t3,p0,p1,p2,p3)]
-    
-    l_co_left  = l_co[:ind_split]
-    l_co_right = l_co[ind_split:]
-    tsplit = ind_split / (len(l_co)-1)
-    return cubic_bezier_fit_points(l_co_left, error_scale, depth=depth+1, t0=t0, t3=tsplit) + cubic_bezier_fit_points(l_co_right, error_scale, depth=depth+1, t0=tsplit, t3=t3)
+    fitter = CubicBezierFitter(l_co)
+    return fitter.fit_range(0, len(l_co), error_scale, depth=depth, t0=t0, t3=t3, allow_split=allow_split, force_split=force_split)
 
 def cubic_bezier_split(p0, p1, p2, p3, t_split, error_scale, tessellate=10):
     tm0 = t_split / tessellate
     tm1 = (1-t_split) / tessellate
-    pts0 = [cubic_bezier_blend_t(p0,p1,p2,p3,tm0*i) for i in range(tessellate+1)]
-    pts1 = [cubic_bezier_blend_t(p0,p1,p2,p3,t_split+tm1*i) for i in range(tessellate+1)]
+    pts0 = cubic_bezier_blend_ts(p0,p1,p2,p3, [tm0*i for i in range(tessellate+1)])
+    pts1 = cubic_bezier_blend_ts(p0,p1,p2,p3, [t_split+tm1*i for i in range(tessellate+1)])
     cb0 = cubic_bezier_fit_points(pts0, error_scale, allow_split=False)
     cb1 = cubic_bezier_fit_points(pts1, error_scale, allow_split=False)
     return [cb[0][2:] for cb in [cb0,cb1] if cb]
@@ -390,3 +554,116 @@ def sort_objects_by_angles(vec_about, l_objs, l_vecs):
     l_inds = sorted(range(len(l_objs)), key=lambda i: l_angles[i])
     return [l_objs[i] for i in l_inds]
 
+
+class StrokeResampler(object):
+    '''
+    subdivides a stroke of (position, radius) samples as it is fed, so that
+    neighboring samples are at most (r0+r1)/spacing apart
+    each segment is halved until its halves are short enough (and at least
+    min_subdivisions times), so samples come out in one pass with no list rebuilding
+    positions can be Vectors or tuples (ex: 2D mouse positions)
+    '''
+    def __init__(self, spacing=20.0, min_subdivisions=0, max_depth=16):
+        self.spacing = spacing
+        self.min_subdivisions = min_subdivisions
+        self.max_depth = max_depth              # guards against zero radii
+        self.last = None
+    
+    @staticmethod
+    def min_subdivisions_for(count, min_count):
+        '''
+        number of times each segment of a count sample stroke must be halved to have more than min_count samples
+        '''
+        k = 0
+        while count > 1 and (count-1) * 2**k + 1 <= min_count: k += 1
+        return k
+    
+    def add(self, pt, pr):
+        '''
+        yields the new samples up to and including (pt,pr)
+        '''
+        if self.last is None:
+            self.last = (pt,pr)
+            yield (pt,pr)
+            return
+        s0,self.last = self.last,(pt,pr)
+        yield from self._subdivide(s0, self.last, 0)
+    
+    def _subdivide(self, s0, s1, depth):
+        (pt0,pr0),(pt1,pr1) = s0,s1
+        if isinstance(pt0, tuple):
+            d = math.sqrt(sum((v0-v1)**2 for v0,v1 in zip(pt0,pt1)))
+        else:
+            d = (pt0-pt1).length
+        if depth < self.max_depth and (depth < self.min_subdivisions or d > (pr0+pr1)/self.spacing):
+            if isinstance(pt0, tuple):
+                ptm = tuple((v0+v1)/2 for v0,v1 in zip(pt0,pt1))
+            else:
+                ptm = (pt0+pt1)/2
+            sm = (ptm, (pr0+pr1)/2)
+            yield from self._subdivide(s0, sm, depth+1)
+            yield from self._subdivide(sm, s1, depth+1)
+        else:
+            yield s1
+    
+    def resample(self, stroke):
+        for pt,pr in stroke:
+            yield from self.add(pt, pr)
+
+
+def stroke_self_intersections(stroke):
+    '''
+    finds every place where stroke (list of (3d location, radius)) crosses itself
+    samples i0 < i1 overlap if they are closer than the smaller radius and
+    the stroke goes far enough away (sum of radii) between them
+    returns list of (i0,i1), the deepest overlapping pair of each crossing, deepest crossing first
+    '''
+    n = len(stroke)
+    if n < 3: return []
+    pts = [(p[0],p[1],p[2]) for p,r in stroke]
+    rads = [r for p,r in stroke]
+    cell = max(rads)
+    if cell <= 0: return []
+
+    def dist(a, b):
+        return math.sqrt((a[0]-b[0])**2 + (a[1]-b[1])**2 + (a[2]-b[2])**2)
+
+    # overlapping samples are less than max radius apart, so they are in neighboring cells
+    grid = {}
+    keys = []
+    for i,p in enumerate(pts):
+        key = (int(math.floor(p[0]/cell)), int(math.floor(p[1]/cell)), int(math.floor(p[2]/cell)))
+        keys.append(key)
+        grid.setdefault(key, []).append(i)
+
+    overlaps = {}
+    for i0 in range(n):
+        p0,r0 = pts[i0],rads[i0]
+        # find where we start to be far enough away
+        i_far = i0+1
+        while i_far < n and dist(p0, pts[i_far]) <= r0+rads[i_far]: i_far += 1
+        if i_far == n: continue
+        x,y,z = keys[i0]
+        for key in [(x+dx,y+dy,z+dz) for dx in (-1,0,1) for dy in (-1,0,1) for dz in (-1,0,1)]:
+            for i1 in grid.get(key, []):
+                if i1 < i_far: continue
+                d = dist(p0, pts[i1]) - min(r0, rads[i1])
+                if d < 0: overlaps[(i0,i1)] = d
+
+    # overlapping pairs next to each other (in index space) belong to the same crossing
+    parent = {pair:pair for pair in overlaps}
+    def find(pair):
+        while parent[pair] != pair:
+            parent[pair] = parent[parent[pair]]
+            pair = parent[pair]
+        return pair
+    for i0,i1 in overlaps:
+        for j0,j1 in [(i0+1,i1-1),(i0+1,i1),(i0+1,i1+1),(i0,i1+1)]:
+            if (j0,j1) in overlaps: parent[find((j0,j1))] = find((i0,i1))
+
+    deepest = {}
+    for pair in sorted(overlaps):
+        root = find(pair)
+        if root not in deepest or overlaps[pair] < overlaps[deepest[root]]:
+            deepest[root] = pair
+    return sorted(deepest.values(), key=lambda pair: (overlaps[pair],pair))
@@ -0,0 +1,131 @@
+'''
+Copyright (C) 2014 CG Cookie
+http://cgcookie.com
+hello@cgcookie.com
+
+Created by Jonathan Denning, Jonathan Williamson, and Patrick Moore
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import weakref
+
+from polystrips_math import dprint
+
+
+
+def view_key(r3d):
+    '''
+    hashable key of everything ray_cast_visible depends on in r3d
+    '''
+    return (tuple(v for row in r3d.view_matrix for v in row), getattr(r3d, 'is_perspective', True))
+
+
+class VisibilityCache(object):
+    '''
+    Visibility of the gverts and gedges (igverts) of a PolyStrips, cached for
+    one view.  An item is ray cast again only if the update graph reports it
+    as changed or the view changes; all pending points go to the surface in
+    one ray_cast_visible call.
+
+    Extra groups of points that never move (ex: non-manifold edges to snap
+    to) can be registered with set_static_points; they are re-tested only
+    when the view changes.
+    '''
+
+    def __init__(self, polystrips):
+        self.polystrips = polystrips
+        self.key = None
+        self.valid = weakref.WeakSet()  # items whose visibility is up to date for self.key
+
+        self.static_points  = []        # groups of points
+        self.static_visible = []        # whether all points of each group are visible
+        self.static_valid   = False
+
+        # counters
+        self.hits   = 0                 # items whose visibility came from the cache
+        self.misses = 0                 # items that were ray cast
+        self.points = 0                 # points ray cast
+        self.calls  = 0                 # ray_cast_visible calls
+
+        polystrips.graph.add_listener(self.invalidate)
+
+    def invalidate(self, gverts, gedges):
+        '''
+        update graph listener
+        '''
+        for item in gverts + gedges: self.valid.discard(item)
+        for ge in gedges:
+            # zipped gedges move their gverts without recomputing their corners
+            for gv in ge.gverts(): self.valid.discard(gv)
+
+    def invalidate_all(self):
+        self.valid = weakref.WeakSet()
+        self.static_valid = False
+
+    def set_static_points(self, llp):
+        self.static_points = [list(lp) for lp in llp]
+        self.static_visible = []
+        self.static_valid = False
+
+    def update(self, r3d):
+        '''
+        brings visibility of every gvert and gedge up to date for view r3d
+        '''
+        key = view_key(r3d)
+        if key != self.key:
+            self.invalidate_all()
+            self.key = key
+
+        ps = self.polystrips
+        lgv = [gv for gv in ps.gverts if gv not in self.valid]
+        lge = [ge for ge in ps.gedges if ge not in self.valid]
+        self.hits += len(ps.gverts) + len(ps.gedges) - len(lgv) - len(lge)
+        self.misses += len(lgv) + len(lge)
+
+        lp = [gv.snap_pos for gv in lgv]
+        lp += [p for ge in lge for p in ge.cache_igverts.positions]
+        if not self.static_valid: lp += [p for lsp in self.static_points for p in lsp]
+        if not lp: return
+
+        lv = ps.surface.ray_cast_visible(lp, r3d)
+        self.points += len(lp)
+        self.calls += 1
+
+        i = 0
+        for gv in lgv:
+            gv.visible = lv[i]
+            i += 1
+        for ge in lge:
+            n = len(ge.cache_igverts)
+            ge.cache_igverts.visible = list(lv[i:i+n])
+            i += n
+        if not self.static_valid:
+            self.static_visible = []
+            for lsp in self.static_points:
+                self.static_visible.append(all(lv[i:i+len(lsp)]))
+                i += len(lsp)
+            self.static_valid = True
+
+        self.valid.update(lgv)
+        self.valid.update(lge)
+        dprint('visibility: %i items cached, %i items / %i points ray cast' % (len(ps.gverts)+len(ps.gedges)-len(lgv)-len(lge), len(lgv)+len(lge), len(lp)), l=4)
+
+    def get_stats(self):
+        return {
+            'hits':   self.hits,
+            'misses': self.misses,
+            'points': self.points,
+            'calls':  self.calls,
+            }